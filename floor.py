@@ -3,6 +3,31 @@ import ursina
 from PIL import Image
 import numpy as np
 
+
+def find_runs(is_black: np.ndarray, min_length: int = 2):
+    """
+    Find all horizontal runs of black pixels at once, without looping over pixels
+
+    Args:
+        is_black (np.ndarray): boolean array of shape (height, width)
+        min_length (int): shorter runs are skipped
+
+    Returns:
+        tuple: arrays with the row, first column and end column (exclusive) of each run
+    """
+
+    padded = np.zeros((is_black.shape[0], is_black.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = is_black
+
+    # +1 там, где отрезок начинается, -1 сразу после его конца
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    long_enough = ends - starts >= min_length
+    return rows[long_enough], starts[long_enough], ends[long_enough]
+
+
 class Floor:
     def __init__(self):
         self.ground = ursina.Entity(
@@ -30,58 +55,40 @@ class Floor:
             is_black = np.all(img_array == [0, 0, 0], axis=2)
             
             # 1. Горизонтальные линии
-            for y in range(map_height):
-                x = 0
-                while x < map_width:
-                    if is_black[y, x]:
-                        start_x = x
-                        while x < map_width and is_black[y, x]:
-                            x += 1
-                        end_x = x - 1
-                        
-                        if end_x > start_x:  # Линия длиной >1 пикселя
-                            center_x = (start_x + end_x) / 2
-                            pos_x = (center_x - map_width/2) * scale_x
-                            pos_z = -(y - map_height/2) * scale_z
-                            
-                            ursina.Entity(
-                                model='cube',
-                                position=(pos_x, 1, pos_z),
-                                scale=((end_x - start_x + 1) * scale_x, 6, scale_z),
-                                texture='wall.png',
-                                collider='box',
-                                color=ursina.color.rgb(30, 30, 50),
-                                texture_scale = ((end_x - start_x + 1) * scale_x / 2, 6 / 2)
-                            )
-                    else:
-                        x += 1
-            
-            # 2. Вертикальные линии
-            for x in range(map_width):
-                y = 0
-                while y < map_height:
-                    if is_black[y, x]:
-                        start_y = y
-                        while y < map_height and is_black[y, x]:
-                            y += 1
-                        end_y = y - 1
-                        
-                        if end_y > start_y:
-                            center_y = (start_y + end_y) / 2
-                            pos_x = (x - map_width/2) * scale_x
-                            pos_z = -(center_y - map_height/2) * scale_z
-                            
-                            ursina.Entity(
-                                model='cube',
-                                position=(pos_x, 1, pos_z),
-                                scale=(scale_x, 6, (end_y - start_y + 1) * scale_z),
-                                texture='wall.png',
-                                collider='box',
-                                color=ursina.color.rgb(30, 30, 50),
-                                texture_scale = ((end_y - start_y + 1) * scale_z / 2, 6 / 2)
-                            )
-                    else:
-                        y += 1
+            rows, starts, ends = find_runs(is_black)
+            for y, start_x, end_x in zip(rows.tolist(), starts.tolist(), ends.tolist()):
+                length = end_x - start_x
+                center_x = (start_x + end_x - 1) / 2
+                pos_x = (center_x - map_width/2) * scale_x
+                pos_z = -(y - map_height/2) * scale_z
+
+                ursina.Entity(
+                    model='cube',
+                    position=(pos_x, 1, pos_z),
+                    scale=(length * scale_x, 6, scale_z),
+                    texture='wall.png',
+                    collider='box',
+                    color=ursina.color.rgb(30, 30, 50),
+                    texture_scale = (length * scale_x / 2, 6 / 2)
+                )
+
+            # 2. Вертикальные линии (те же отрезки в транспонированной картинке)
+            columns, starts, ends = find_runs(is_black.T)
+            for x, start_y, end_y in zip(columns.tolist(), starts.tolist(), ends.tolist()):
+                length = end_y - start_y
+                center_y = (start_y + end_y - 1) / 2
+                pos_x = (x - map_width/2) * scale_x
+                pos_z = -(center_y - map_height/2) * scale_z
+
+                ursina.Entity(
+                    model='cube',
+                    position=(pos_x, 1, pos_z),
+                    scale=(scale_x, 6, length * scale_z),
+                    texture='wall.png',
+                    collider='box',
+                    color=ursina.color.rgb(30, 30, 50),
+                    texture_scale = (length * scale_z / 2, 6 / 2)
+                )
 
         except Exception as e:
             print(f"Ошибка: {e}")
\ No newline at end of file
@@ -1,43 +1,75 @@
-import random
+import numpy as np
 import ursina
 
-from enemy import Enemy
+from projectiles import Projectiles
 
+# Bullets are simulated in steps of this many seconds, whatever the frame rate
+BULLET_STEP = 1 / 60
+# Most steps simulated in one frame, so a long frame doesn't stall the next ones
+MAX_BULLET_STEPS = 5
 
-class Bullet(ursina.Entity):
-    def __init__(self, position: ursina.Vec3, direction: float, x_direction: float, network, damage: int = random.randint(5, 20), slave=False):
-        speed = 35
-        dir_rad = ursina.math.radians(direction)
-        x_dir_rad = ursina.math.radians(x_direction)
 
-        self.velocity = ursina.Vec3(
-            ursina.math.sin(dir_rad) * ursina.math.cos(x_dir_rad),
-            ursina.math.sin(x_dir_rad),
-            ursina.math.cos(dir_rad) * ursina.math.cos(x_dir_rad)
-        ) * speed
+class ProjectileManager(ursina.Entity):
+    """
+    Draws the bullets in flight. They are simulated together in fixed steps by projectiles.Projectiles, with one
+    recycled entity per slot. Bullets are only drawn, damage is decided by the server.
 
-        super().__init__(
-            position=position + self.velocity / speed,
-            model="sphere",
-            collider="box",
-            scale=0.2
-        )
+    Args:
+        world: level geometry, a collision.StaticCollisionWorld
+        targets: entities that stop bullets, with a health attribute (an EntityRegistry of enemies)
+        size (int): most bullets in flight, the oldest one is recycled when a new one doesn't fit
+    """
 
-        self.damage = damage
-        self.direction = direction
-        self.x_direction = x_direction
-        self.slave = slave
-        self.network = network
+    def __init__(self, world, targets, size: int = 128):
+        super().__init__()
+
+        self.world = world
+        self.targets = targets
+        self.projectiles = Projectiles(size)
+        self.accumulator = 0
+
+        self.entities = [
+            ursina.Entity(parent=self, model="sphere", scale=0.2, enabled=False)
+            for _ in range(size)
+        ]
+
+    def spawn(self, position, direction: float, x_direction: float):
+        """
+        Fire a bullet
+
+        Args:
+            position: (x, y, z) where it is fired from
+            direction (float): rotation around the y axis in degrees
+            x_direction (float): rotation around the x axis in degrees
+        """
+
+        index = self.projectiles.spawn(position, direction, x_direction)
+
+        entity = self.entities[index]
+        entity.position = ursina.Vec3(*self.projectiles.positions[index])
+        entity.enabled = True
+
+    def step(self, dt: float):
+        # Enemies are boxes standing on their position (origin_y=-0.5)
+        targets = [target for target in self.targets if target.health > 0]
+        target_mins = np.array([
+            (target.world_x - target.scale_x / 2, target.world_y, target.world_z - target.scale_z / 2)
+            for target in targets
+        ]).reshape(-1, 3)
+        target_maxs = np.array([
+            (target.world_x + target.scale_x / 2, target.world_y + target.scale_y, target.world_z + target.scale_z / 2)
+            for target in targets
+        ]).reshape(-1, 3)
+
+        for index in self.projectiles.step(dt, self.world, target_mins, target_maxs):
+            self.entities[index].enabled = False
 
     def update(self):
-        self.position += self.velocity * ursina.time.dt
-        hit_info = self.intersects()
+        self.accumulator = min(self.accumulator + ursina.time.dt, BULLET_STEP * MAX_BULLET_STEPS)
 
-        if hit_info.hit:
-            if not self.slave:
-                for entity in hit_info.entities:
-                    if isinstance(entity, Enemy):
-                        entity.health -= self.damage
-                        self.network.send_health(entity)
+        while self.accumulator >= BULLET_STEP:
+            self.accumulator -= BULLET_STEP
+            self.step(BULLET_STEP)
 
-            ursina.destroy(self)
+        for index in np.flatnonzero(self.projectiles.alive):
+            self.entities[index].position = ursina.Vec3(*self.projectiles.positions[index])
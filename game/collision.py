@@ -0,0 +1,315 @@
+"""
+Collision queries against the level geometry that never moves, without going through the Ursina scene. Boxes are
+bucketed into a uniform grid on the ground plane so a query only looks at the boxes near it, whatever the size of the
+map. Nothing in here depends on Ursina, the server can use it too.
+"""
+
+import math
+
+import numpy as np
+
+from movement import RayHit, SlideResult
+
+# Side of a grid cell in world units, a little larger than the distance covered by a player in a frame
+CELL_SIZE = 8
+# Boxes overlapping the player by less than this are treated as touching, not as already stuck inside
+CONTACT_TOLERANCE = 1e-6
+
+
+def _ray_boxes(origin: np.ndarray, direction: np.ndarray, mins: np.ndarray, maxs: np.ndarray):
+    """
+    Slab test of rays against axis-aligned boxes, all at once. Arguments broadcast against each other on every
+    dimension but the last, which holds x, y and z.
+
+    Returns:
+        tuple: distance along the ray (in lengths of direction) where each box is entered and exited, and the axis
+            of the face it enters through. A box is missed when the entry distance is greater than the exit distance.
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (mins - origin) / direction
+        t2 = (maxs - origin) / direction
+
+    # A ray parallel to an axis is inside that slab everywhere or nowhere
+    parallel = np.broadcast_to(direction == 0, t1.shape)
+    inside = (mins <= origin) & (origin <= maxs)
+    near = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    far = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+
+    return near.max(axis=-1), far.min(axis=-1), near.argmax(axis=-1)
+
+
+def segments_hit_boxes(starts: np.ndarray, ends: np.ndarray, mins: np.ndarray, maxs: np.ndarray) -> tuple:
+    """
+    Find where each segment first enters any of the boxes. Boxes a segment starts inside of are ignored.
+
+    Args:
+        starts (np.ndarray): segment starts of shape (segments, 3)
+        ends (np.ndarray): segment ends of shape (segments, 3)
+        mins (np.ndarray): lowest corners of shape (boxes, 3)
+        maxs (np.ndarray): highest corners of shape (boxes, 3)
+
+    Returns:
+        tuple: fraction of each segment travelled before the first hit (inf when nothing is hit), and the index
+            of the box hit (-1 when nothing is hit)
+    """
+
+    if not len(mins) or not len(starts):
+        return np.full(len(starts), np.inf), np.full(len(starts), -1)
+
+    enter, exit, _ = _ray_boxes(starts[:, None, :], (ends - starts)[:, None, :], mins[None, :, :], maxs[None, :, :])
+    enter = np.where((enter <= exit) & (enter >= 0) & (enter <= 1), enter, np.inf)
+
+    nearest = enter.argmin(axis=1)
+    fractions = enter[np.arange(len(starts)), nearest]
+    return fractions, np.where(np.isfinite(fractions), nearest, -1)
+
+
+class StaticCollisionWorld:
+    """
+    Axis-aligned boxes of the level, with ray and box queries
+
+    Args:
+        cell_size (float): side of a grid cell in world units
+    """
+
+    def __init__(self, cell_size: float = CELL_SIZE):
+        self.cell_size = cell_size
+        self.mins = np.zeros((0, 3))
+        self.maxs = np.zeros((0, 3))
+        self.cells = {}
+        self.bounds_min = np.zeros(3)
+        self.bounds_max = np.zeros(3)
+
+    def __len__(self):
+        return len(self.mins)
+
+    def cell(self, x: float, z: float) -> tuple:
+        return math.floor(x / self.cell_size), math.floor(z / self.cell_size)
+
+    def add_boxes(self, positions, scales):
+        """
+        Add solid boxes to the world
+
+        Args:
+            positions: box centres of shape (boxes, 3)
+            scales: box sizes of shape (boxes, 3)
+        """
+
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        half_sizes = np.abs(np.asarray(scales, dtype=np.float64).reshape(-1, 3)) / 2
+        first = len(self.mins)
+
+        self.mins = np.concatenate((self.mins, positions - half_sizes))
+        self.maxs = np.concatenate((self.maxs, positions + half_sizes))
+        self.bounds_min = self.mins.min(axis=0)
+        self.bounds_max = self.maxs.max(axis=0)
+
+        cells = {cell: list(boxes) for cell, boxes in self.cells.items()}
+        for index in range(first, len(self.mins)):
+            min_x, min_z = self.cell(self.mins[index, 0], self.mins[index, 2])
+            max_x, max_z = self.cell(self.maxs[index, 0], self.maxs[index, 2])
+            for cell_x in range(min_x, max_x + 1):
+                for cell_z in range(min_z, max_z + 1):
+                    cells.setdefault((cell_x, cell_z), []).append(index)
+
+        self.cells = {cell: np.array(boxes) for cell, boxes in cells.items()}
+
+    def add_box(self, position, scale):
+        self.add_boxes([position], [scale])
+
+    def query_box(self, box_min, box_max) -> np.ndarray:
+        """
+        Find the boxes overlapping an axis-aligned box
+
+        Args:
+            box_min: (x, y, z) lowest corner
+            box_max: (x, y, z) highest corner
+
+        Returns:
+            np.ndarray: indices of the overlapping boxes in mins and maxs
+        """
+
+        box_min = np.array(tuple(box_min), dtype=np.float64)
+        box_max = np.array(tuple(box_max), dtype=np.float64)
+        min_x, min_z = self.cell(box_min[0], box_min[2])
+        max_x, max_z = self.cell(box_max[0], box_max[2])
+
+        candidates = [
+            self.cells[(cell_x, cell_z)]
+            for cell_x in range(min_x, max_x + 1)
+            for cell_z in range(min_z, max_z + 1)
+            if (cell_x, cell_z) in self.cells
+        ]
+        if not candidates:
+            return np.zeros(0, dtype=int)
+
+        candidates = np.unique(np.concatenate(candidates))
+        overlapping = np.all(
+            (self.mins[candidates] < box_max) & (self.maxs[candidates] > box_min),
+            axis=1
+        )
+        return candidates[overlapping]
+
+    def raycast(self, origin, direction, distance: float = math.inf) -> RayHit:
+        """
+        Find the first box hit by a ray. Boxes the ray starts inside of are ignored.
+
+        Args:
+            origin: (x, y, z) start of the ray
+            direction: (x, y, z) direction of the ray, doesn't need to be normalized
+            distance (float): maximum distance
+
+        Returns:
+            RayHit: like Ursina's raycast
+        """
+
+        # tuple() first so Ursina's Vec3 works as well as plain sequences
+        origin = np.array(tuple(origin), dtype=np.float64)
+        direction = np.array(tuple(direction), dtype=np.float64)
+        direction_length = np.linalg.norm(direction)
+        if direction_length == 0 or not len(self.mins):
+            return RayHit(False)
+        direction = direction / direction_length
+
+        # Only walk the part of the ray that is inside the level
+        enter, exit, _ = _ray_boxes(origin, direction, self.bounds_min[None, :], self.bounds_max[None, :])
+        start, end = max(enter[0], 0), min(exit[0], distance)
+        if start > end:
+            return RayHit(False)
+
+        # Walk the grid cells the ray crosses in order, stopping once the nearest hit is before the next cell
+        cell_x, cell_z = self.cell(origin[0] + direction[0] * start, origin[2] + direction[2] * start)
+        steps, next_boundary, boundary_spacing = [], [], []
+        for axis, cell_index in ((0, cell_x), (2, cell_z)):
+            if direction[axis] == 0:
+                steps.append(0)
+                next_boundary.append(math.inf)
+                boundary_spacing.append(math.inf)
+                continue
+
+            step = 1 if direction[axis] > 0 else -1
+            boundary = (cell_index + (step > 0)) * self.cell_size
+            steps.append(step)
+            next_boundary.append((boundary - origin[axis]) / direction[axis])
+            boundary_spacing.append(self.cell_size / abs(direction[axis]))
+
+        best_distance, best_box, best_axis = math.inf, None, None
+
+        while True:
+            boxes = self.cells.get((cell_x, cell_z))
+            if boxes is not None:
+                box_enter, box_exit, axes = _ray_boxes(origin, direction, self.mins[boxes], self.maxs[boxes])
+                hits = np.flatnonzero((box_enter <= box_exit) & (box_enter >= 0))
+                if len(hits):
+                    nearest = hits[np.argmin(box_enter[hits])]
+                    if box_enter[nearest] < best_distance:
+                        best_distance, best_box, best_axis = box_enter[nearest], boxes[nearest], axes[nearest]
+
+            cell_exit = min(next_boundary)
+            if best_distance <= cell_exit or cell_exit > end:
+                break
+
+            if next_boundary[0] <= next_boundary[1]:
+                cell_x += steps[0]
+                next_boundary[0] += boundary_spacing[0]
+            else:
+                cell_z += steps[1]
+                next_boundary[1] += boundary_spacing[1]
+
+        if best_box is None or best_distance > distance:
+            return RayHit(False)
+
+        normal = [0, 0, 0]
+        normal[best_axis] = -1 if direction[best_axis] > 0 else 1
+        point = tuple((origin + direction * best_distance).tolist())
+        return RayHit(True, float(best_distance), point, tuple(normal))
+
+    def move_and_slide(self, position, radius: float, height: float, motion) -> SlideResult:
+        """
+        Move a player's box, stopping at the first box in the way along each axis and sliding along it on the
+        others. Every box the motion could reach is found with a single grid query.
+
+        Args:
+            position: (x, y, z) bottom centre of the player
+            radius (float): half the width of the player's box
+            height (float): height of the player's box
+            motion: (x, y, z) displacement wanted
+
+        Returns:
+            SlideResult: where the player ended up and the axes that were blocked
+        """
+
+        box_min = np.array((position[0] - radius, position[1], position[2] - radius), dtype=np.float64)
+        box_max = np.array((position[0] + radius, position[1] + height, position[2] + radius), dtype=np.float64)
+        motion = np.array(tuple(motion), dtype=np.float64)
+
+        nearby = self.query_box(np.minimum(box_min, box_min + motion), np.maximum(box_max, box_max + motion))
+        mins, maxs = self.mins[nearby], self.maxs[nearby]
+        blocked = [False, False, False]
+
+        # Vertical first so standing on the ground never blocks walking
+        for axis in (1, 0, 2):
+            distance = motion[axis]
+            if distance == 0:
+                continue
+
+            other = [a for a in range(3) if a != axis]
+            in_the_way = np.all((mins[:, other] < box_max[other]) & (maxs[:, other] > box_min[other]), axis=1)
+
+            if distance > 0:
+                gaps = mins[in_the_way, axis] - box_max[axis]
+                gaps = gaps[gaps >= -CONTACT_TOLERANCE]
+                if len(gaps) and gaps.min() < distance:
+                    distance = max(gaps.min(), 0)
+                    blocked[axis] = True
+            else:
+                gaps = maxs[in_the_way, axis] - box_min[axis]
+                gaps = gaps[gaps <= CONTACT_TOLERANCE]
+                if len(gaps) and gaps.max() > distance:
+                    distance = min(gaps.max(), 0)
+                    blocked[axis] = True
+
+            box_min[axis] += distance
+            box_max[axis] += distance
+
+        new_position = (float(box_min[0] + radius), float(box_min[1]), float(box_min[2] + radius))
+        return SlideResult(new_position, tuple(blocked))
+
+    def segments_hit(self, starts, ends) -> np.ndarray:
+        """
+        Find where many segments first hit the level, with one vectorized test over every segment and the boxes
+        near it
+
+        Args:
+            starts: segment starts of shape (segments, 3)
+            ends: segment ends of shape (segments, 3)
+
+        Returns:
+            np.ndarray: fraction of each segment travelled before the first hit, inf when nothing is hit
+        """
+
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 3)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 3)
+        fractions = np.full(len(starts), np.inf)
+
+        # Pair every segment with the boxes around it
+        segment_indices, box_indices = [], []
+        for index, (start, end) in enumerate(zip(starts, ends)):
+            nearby = self.query_box(np.minimum(start, end), np.maximum(start, end))
+            segment_indices.append(np.full(len(nearby), index))
+            box_indices.append(nearby)
+
+        if not segment_indices:
+            return fractions
+        segment_indices = np.concatenate(segment_indices)
+        box_indices = np.concatenate(box_indices)
+        if not len(box_indices):
+            return fractions
+
+        origins = starts[segment_indices]
+        enter, exit, _ = _ray_boxes(origins, ends[segment_indices] - origins, self.mins[box_indices], self.maxs[box_indices])
+        hits = (enter <= exit) & (enter >= 0) & (enter <= 1)
+
+        np.minimum.at(fractions, segment_indices[hits], enter[hits])
+        return fractions
@@ -1,9 +1,12 @@
 import ursina
 
+from interpolation import SnapshotBuffer, INTERPOLATION_DELAY
+
 
 class Enemy(ursina.Entity):
-    def __init__(self, position: ursina.Vec3, identifier: str, username: str):
+    def __init__(self, position: ursina.Vec3, identifier: str, username: str, clock=None, registry=None, parent=ursina.scene):
         super().__init__(
+            parent=parent,
             position=position,
             model="cube",
             origin_y=-0.5,
@@ -35,7 +38,34 @@ class Enemy(ursina.Entity):
         self.id = identifier
         self.username = username
 
+        # Network updates are buffered and played back slightly in the past, blending between them
+        self.clock = clock
+        self.snapshots = SnapshotBuffer()
+
+        self.registry = registry
+        if registry is not None:
+            registry.add(self)
+
+    def on_destroy(self):
+        # Called by ursina.destroy, however the enemy ends up being destroyed
+        if self.registry is not None:
+            self.registry.remove(self)
+
+    def push_snapshot(self, timestamp: float, position, rotation: float):
+        """
+        Record where the server says this player was at a point in server time
+        """
+
+        self.snapshots.push(timestamp, position, rotation)
+
     def update(self):
+        if self.clock is not None:
+            sample = self.snapshots.sample(self.clock() - INTERPOLATION_DELAY)
+            if sample:
+                position, rotation = sample
+                self.world_position = ursina.Vec3(*position)
+                self.rotation_y = rotation
+
         try:
             color_saturation = 1 - self.health / 100
         except AttributeError:
@@ -0,0 +1,73 @@
+"""
+Smooth remote player movement between network updates
+"""
+
+from collections import deque
+
+# How far behind the server clock remote players are rendered, so there are usually two snapshots to blend between
+INTERPOLATION_DELAY = 0.1
+# How long a player keeps moving along its last known velocity when snapshots stop arriving
+MAX_EXTRAPOLATION = 0.25
+
+
+def lerp_angle(a: float, b: float, t: float) -> float:
+    """
+    Interpolate between two angles in degrees along the shortest way around
+    """
+
+    difference = (b - a + 180) % 360 - 180
+    return a + difference * t
+
+
+class SnapshotBuffer:
+    """
+    Timestamped history of a remote player's position and rotation, sampled at a delayed render time
+
+    Args:
+        size (int): number of snapshots to keep
+    """
+
+    def __init__(self, size: int = 32):
+        self.snapshots = deque(maxlen=size)
+
+    def push(self, timestamp: float, position: tuple, rotation: float):
+        """
+        Record the state of the player at a point in server time. Snapshots older than the newest one are ignored.
+        """
+
+        if self.snapshots and timestamp <= self.snapshots[-1][0]:
+            return
+
+        self.snapshots.append((timestamp, tuple(position), rotation))
+
+    def sample(self, render_time: float):
+        """
+        Get the state of the player at a point in server time
+
+        Args:
+            render_time (float): server time to sample at, normally the current server time minus INTERPOLATION_DELAY
+
+        Returns:
+            tuple: (position, rotation), or None if nothing has been recorded yet
+        """
+
+        snapshots = list(self.snapshots)
+
+        if not snapshots:
+            return None
+
+        if len(snapshots) == 1 or render_time <= snapshots[0][0]:
+            return snapshots[0][1], snapshots[0][2]
+
+        # Blend between the two snapshots on either side of the render time
+        for (start_time, start_pos, start_rot), (end_time, end_pos, end_rot) in zip(snapshots, snapshots[1:]):
+            if start_time <= render_time <= end_time:
+                t = (render_time - start_time) / (end_time - start_time)
+                position = tuple(a + (b - a) * t for a, b in zip(start_pos, end_pos))
+                return position, lerp_angle(start_rot, end_rot, t)
+
+        # Render time is past the newest snapshot, keep moving along the last velocity for a little while
+        (start_time, start_pos, start_rot), (end_time, end_pos, end_rot) = snapshots[-2:]
+        t = 1 + min(render_time - end_time, MAX_EXTRAPOLATION) / (end_time - start_time)
+        position = tuple(a + (b - a) * t for a, b in zip(start_pos, end_pos))
+        return position, lerp_angle(start_rot, end_rot, t)
@@ -0,0 +1,68 @@
+"""
+Everything solid in the level, as plain boxes: the ground, the walls generated from the map image and the wall
+blocks of Map. The client draws it with Floor and Map, and the client and the server collide with the same boxes, so
+predicted and authoritative movement agree.
+"""
+
+import numpy as np
+
+from collision import StaticCollisionWorld
+from mapcache import MAP_PATH, load_walls
+from walls import PLANE_WIDTH, PLANE_DEPTH
+
+# The ground collides as a slab whose top is the ground plane
+GROUND_POSITION = (0, -0.5, 0)
+GROUND_SCALE = (PLANE_WIDTH, 1, PLANE_DEPTH)
+
+# Blocks are 2 units wide and stand on their position (origin_y=-0.5)
+BLOCK_SIZE = (2, 2, 2)
+# Collision of a block is twice as tall as the block and centred on its position
+BLOCK_COLLIDER_SIZE = (2, 4, 2)
+
+
+def block_positions() -> np.ndarray:
+    """
+    Positions of the wall blocks of Map, two layers high
+
+    Returns:
+        np.ndarray: float32 array of shape (blocks, 3)
+    """
+
+    positions = []
+
+    for y in range(1, 4, 2):
+        positions += [
+            (6, y, 0),
+            (6, y, 2),
+            (6, y, 4),
+            (6, y, 6),
+            (6, y, 8),
+
+            (4, y, 8),
+            (2, y, 8),
+            (0, y, 8),
+            (-2, y, 8)
+        ]
+
+    return np.array(positions, dtype=np.float32)
+
+
+def build_collision_world(map_path: str = MAP_PATH) -> StaticCollisionWorld:
+    """
+    Args:
+        map_path (str): path of the map image the walls are generated from
+
+    Returns:
+        StaticCollisionWorld: the ground, the map's walls and the blocks
+    """
+
+    world = StaticCollisionWorld()
+    world.add_box(GROUND_POSITION, GROUND_SCALE)
+
+    geometry = load_walls(map_path)
+    world.add_boxes(geometry["positions"], geometry["scales"])
+
+    blocks = block_positions()
+    world.add_boxes(blocks, np.broadcast_to(BLOCK_COLLIDER_SIZE, blocks.shape))
+
+    return world
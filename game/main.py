@@ -1,7 +1,7 @@
 import os
-import sys
 import socket
 import threading
+import queue
 import asyncio
 import ursina
 import time
@@ -13,14 +13,20 @@ from floor import Floor
 from map import Map
 from player import Player
 from enemy import Enemy
-from bullet import Bullet
+from registry import EntityRegistry
+from bullet import ProjectileManager
+from movement import MovementState
+from level import build_collision_world
+from particles import ParticlePool
+from interpolation import INTERPOLATION_DELAY
 
 
 username = input("Enter your username: ")
 
 while True:
     server_addr = input("Enter server IP: ")
-    n = Network(server_addr, 8000, username)
+    room = input("Enter room (leave empty to join any): ") or None
+    n = Network(server_addr, 8000, username, room=room)
     n.settimeout(5)
 
     error_occurred = False
@@ -47,6 +53,9 @@ ursina.window.borderless = False
 ursina.window.title = "Ursina FPS"
 ursina.window.exit_button.visible = False
 
+# Walls and ground are only collided with through this, not through the scene's colliders. The server builds the
+# same one to check movement and shots.
+collision_world = build_collision_world()
 floor = Floor()
 map = Map()
 sky = ursina.Entity(
@@ -55,10 +64,42 @@ sky = ursina.Entity(
     scale=9999,
     double_sided=True
 )
-player = Player(ursina.Vec3(0, 1, 0))
+player = Player(ursina.Vec3(0, 1, 0), world=collision_world)
+if n.authoritative:
+    # Movement is predicted locally and confirmed by the server
+    player.on_command = n.send_input
 prev_pos = player.world_position
 prev_dir = player.world_rotation_y
-enemies = []
+enemies = EntityRegistry()
+# Parent of every enemy, so shots only traverse the enemies' colliders
+enemy_root = ursina.Entity()
+
+# Shot effects are recycled instead of creating entities on every shot
+tracers = ParticlePool(
+    size=512,
+    lifetime=0.2,
+    model='sphere',
+    start_scale=0.05,
+    end_scale=0,
+    start_color=ursina.color.rgba(100, 100, 100, 50),
+    end_color=ursina.color.rgb(100, 100, 100)
+)
+# Bullets in flight, simulated together and recycled on hit or timeout
+projectiles = ProjectileManager(collision_world, enemies)
+hit_markers = ParticlePool(
+    size=16,
+    lifetime=0.3,
+    model='circle',
+    start_scale=0.1,
+    end_scale=0.5,
+    start_color=ursina.color.black,
+    end_color=ursina.color.rgba(150, 150, 150, 0)
+)
+
+# Messages decoded by the network thread, waiting to be applied to the scene by the render loop
+inbound = queue.SimpleQueue()
+# Most messages applied in a single frame, the rest wait for the next ones
+MAX_MESSAGES_PER_FRAME = 64
 
 # Reload indicator
 reload_indicator = ursina.Entity(
@@ -82,6 +123,7 @@ def update_reload_indicator(progress):
         reload_indicator.scale_y = 0.3 * progress
 
 def receive():
+    """Network thread: only decodes messages and hands them over to the render loop"""
     while True:
         try:
             info = n.receive_info()
@@ -89,68 +131,87 @@ def receive():
             print(e)
             continue
 
+        inbound.put(info)
+
         if not info:
-            print("Server has stopped! Exiting...")
-            sys.exit()
+            return
 
-        if info["object"] == "player":
-            enemy_id = info["id"]
+def process_messages():
+    """Apply a bounded batch of received messages, called every frame from update()"""
+    for _ in range(MAX_MESSAGES_PER_FRAME):
+        try:
+            info = inbound.get_nowait()
+        except queue.Empty:
+            return
 
-            if info["joined"]:
-                new_enemy = Enemy(ursina.Vec3(*info["position"]), enemy_id, info["username"])
-                new_enemy.health = info["health"]
-                enemies.append(new_enemy)
-                continue
+        if not info:
+            print("Server has stopped! Exiting...")
+            ursina.application.quit()
+            return
 
-            enemy = None
+        handle_message(info)
 
-            for e in enemies:
-                if e.id == enemy_id:
-                    enemy = e
-                    break
+def handle_message(info):
+    if info["object"] == "player":
+        enemy_id = info["id"]
 
-            if not enemy:
-                continue
+        if info["joined"]:
+            new_enemy = Enemy(ursina.Vec3(*info["position"]), enemy_id, info["username"], clock=n.server_time, registry=enemies, parent=enemy_root)
+            new_enemy.health = info["health"]
+            return
 
-            if info["left"]:
-                enemies.remove(enemy)
-                ursina.destroy(enemy)
-                continue
+        enemy = enemies.get(enemy_id)
 
-            enemy.world_position = ursina.Vec3(*info["position"])
-            enemy.rotation_y = info["rotation"]
+        if not enemy:
+            return
 
-        elif info["object"] == "bullet":
-            b_pos = ursina.Vec3(*info["position"])
-            b_dir = info["direction"]
-            b_x_dir = info["x_direction"]
-            b_damage = info["damage"]
-            new_bullet = Bullet(b_pos, b_dir, b_x_dir, n, b_damage, slave=True)
-            ursina.destroy(new_bullet, delay=2)
+        if info["left"]:
+            ursina.destroy(enemy)
+            return
 
-        elif info["object"] == "health_update":
-            enemy_id = info["id"]
+        enemy.push_snapshot(n.server_time(), info["position"], info["rotation"])
 
-            enemy = None
+    elif info["object"] == "snapshot":
+        timestamp = info["tick"] / n.tick_rate
 
-            if enemy_id == n.id:
-                enemy = player
-            else:
-                for e in enemies:
-                    if e.id == enemy_id:
-                        enemy = e
-                        break
+        for state in info["players"]:
+            enemy = enemies.get(state["id"])
 
             if not enemy:
                 continue
 
-            enemy.health = info["health"]
+            enemy.push_snapshot(timestamp, state["position"], state["rotation"])
+
+    elif info["object"] == "bullet":
+        b_pos = ursina.Vec3(*info["position"])
+        b_dir = info["direction"]
+        b_x_dir = info["x_direction"]
+        projectiles.spawn(b_pos, b_dir, b_x_dir)
+
+    elif info["object"] == "health_update":
+        enemy_id = info["id"]
+
+        if enemy_id == n.id:
+            enemy = player
+        else:
+            enemy = enemies.get(enemy_id)
+
+        if not enemy:
+            return
+
+        enemy.health = info["health"]
+
+    elif info["object"] == "move_state":
+        player.correct(info["sequence"], MovementState.from_dict(info))
 
 def update():
+    process_messages()
+
     if player.health > 0:
         global prev_pos, prev_dir
 
-        if prev_pos != player.world_position or prev_dir != player.world_rotation_y:
+        # With authoritative movement the server takes positions from the input commands instead
+        if not n.authoritative and (prev_pos != player.world_position or prev_dir != player.world_rotation_y):
             n.send_player(player)
 
         prev_pos = player.world_position
@@ -183,13 +244,21 @@ def reload_weapon(weapon):
 def input(key):
     if key == "left mouse down" and player.health > 0:
         weapon = player.inventory[player.hand]
-        if weapon.bullets > 0 and not weapon.reloading:
-            # Делаем raycast от камеры вперед
-            ray1 = ursina.raycast(player.camera_pivot.world_position, player.camera_pivot.forward*300, ignore=[player], debug=False)
+        if weapon.bullets > 0 and not weapon.reloading and time.monotonic() - weapon.lastShot >= weapon.shootDelay:
+            weapon.lastShot = time.monotonic()
+            # Делаем raycast от камеры вперед: стены через collision_world, враги через их коллайдеры
+            ray1 = collision_world.raycast(player.camera_pivot.world_position, player.camera_pivot.forward)
+            enemy_ray = ursina.raycast(player.camera_pivot.world_position, player.camera_pivot.forward, traverse_target=enemy_root, debug=False)
+            if enemy_ray.hit and enemy_ray.distance < ray1.distance:
+                ray1 = enemy_ray
+
+            # Попадание и урон проверяет сервер, по тем позициям врагов, которые были видны в момент выстрела
+            render_tick = (n.server_time() - INTERPOLATION_DELAY) * n.tick_rate
+            n.send_fire(player.camera_pivot.world_position, player.camera_pivot.forward, render_tick)
             
             if ray1.hit:
                 # Получаем точку попадания
-                hit_point = ray1.world_point
+                hit_point = ursina.Vec3(*ray1.world_point)
                 
                 # Позиция оружия в мировых координатах
                 # Используем позицию оружия на экране, преобразуя её в мировые координаты
@@ -222,40 +291,11 @@ def input(key):
                         random.uniform(-spread, spread)
                     )
                     
-                    # Создаем частицу
-                    particle = ursina.Entity(
-                        model='sphere',
-                        color=ursina.color.rgba(100, 100, 100, 50),
-                        position=particle_pos,
-                        scale=0.05,
-                        billboard=True
-                    )
-                    
-                    # Добавляем затухание и уничтожение
-                    particle.animate_scale(0, duration=0.2)
-                    particle.animate_color(ursina.color.rgb(100, 100, 100), duration=0.2)
-                    ursina.destroy(particle, delay=0.2)
-                
-                # Создаем маркер в точке попадания
-                hit_marker = ursina.Entity(
-                    model='circle',
-                    color=ursina.color.black,
-                    scale=0.1,
-                    position=hit_point,
-                    billboard=True
-                )
-                
-                # Анимация маркера попадания
-                hit_marker.animate_scale(0.5, duration=0.3)
-                hit_marker.animate_color(ursina.color.rgba(150, 150, 150, 0), duration=0.3)
-                ursina.destroy(hit_marker, delay=0.3)
+                    # Берём частицу из пула, она сама уменьшится и исчезнет
+                    tracers.emit(particle_pos)
                 
-                # Если попали во врага
-                if hasattr(ray1.entity, 'health') and ray1.entity.health > 0:
-                    # Рассчитываем урон (как в исходном коде)
-                    damage = random.randint(5, 20)
-                    ray1.entity.health -= damage
-                    n.send_health(ray1.entity)
+                # Маркер в точке попадания
+                hit_markers.emit(hit_point)
                 
                 print(f"Выстрел в точку: {hit_point}, расстояние: {ray1.distance}")
             
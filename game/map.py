@@ -1,30 +1,17 @@
 import os
-import ursina
 
-
-class Wall(ursina.Entity):
-    def __init__(self, position):
-        super().__init__(
-            position=position,
-            scale=2,
-            model="cube",
-            texture=os.path.join("assets", "wall.png"),
-            origin_y=-0.5
-        )
-        self.texture.filtering = None
-        self.collider = ursina.BoxCollider(self, size=ursina.Vec3(1, 2, 1))
+from level import BLOCK_SIZE, block_positions
+from static_geometry import StaticGeometry
+from walls import static_geometry
 
 
 class Map:
     def __init__(self):
-        for y in range(1, 4, 2):
-            Wall(ursina.Vec3(6, y, 0))
-            Wall(ursina.Vec3(6, y, 2))
-            Wall(ursina.Vec3(6, y, 4))
-            Wall(ursina.Vec3(6, y, 6))
-            Wall(ursina.Vec3(6, y, 8))
+        # Collision of the blocks is part of level.build_collision_world
+        positions = block_positions()
+        centres = positions + (0, BLOCK_SIZE[1] / 2, 0)
+        sizes = [BLOCK_SIZE] * len(positions)
 
-            Wall(ursina.Vec3(4, y, 8))
-            Wall(ursina.Vec3(2, y, 8))
-            Wall(ursina.Vec3(0, y, 8))
-            Wall(ursina.Vec3(-2, y, 8))
+        self.geometry = StaticGeometry(static_geometry(centres, sizes), texture=os.path.join("assets", "wall.png"))
+        for chunk in self.geometry.chunks:
+            chunk.texture.filtering = None
@@ -0,0 +1,110 @@
+"""
+Baked map geometry: the wall boxes generated from the map image and their combined mesh are saved next to it, so
+later launches load them without decoding the image again. The cache is keyed by a hash of the image and of the
+constants used to place the walls, and is rebuilt automatically when either changes.
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+from PIL import Image
+
+import walls
+
+MAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "map.png")
+# Bump when the generated geometry changes without the image or the constants changing
+CACHE_VERSION = 3
+CACHE_ARRAYS = ("positions", "scales", "chunks", "vertices", "normals", "uvs", "triangles")
+
+
+def cache_key(map_path: str) -> str:
+    """
+    Hash of everything the baked geometry depends on
+
+    Args:
+        map_path (str): path of the map image
+
+    Returns:
+        str: hex digest
+    """
+
+    digest = hashlib.sha1()
+    with open(map_path, "rb") as file:
+        digest.update(file.read())
+
+    constants = (CACHE_VERSION, walls.PLANE_WIDTH, walls.PLANE_DEPTH, walls.WALL_HEIGHT, walls.WALL_Y)
+    digest.update(repr(constants).encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_path(map_path: str, key: str, name: str) -> str:
+    base, _ = os.path.splitext(map_path)
+    return f"{base}.{key}.{name}.npy"
+
+
+def build(map_path: str) -> dict:
+    """
+    Generate the wall geometry from the map image
+
+    Args:
+        map_path (str): path of the map image
+
+    Returns:
+        dict: walls.static_geometry arrays
+    """
+
+    img = Image.open(map_path).convert("RGB")
+    map_width, map_height = img.size
+
+    rectangles = walls.merge_rectangles(walls.wall_mask(np.array(img)))
+    boxes = walls.rectangles_to_boxes(rectangles, map_width, map_height)
+
+    positions = np.array([position for position, _ in boxes], dtype=np.float32).reshape(-1, 3)
+    scales = np.array([scale for _, scale in boxes], dtype=np.float32).reshape(-1, 3)
+    return walls.static_geometry(positions, scales)
+
+
+def save(map_path: str, key: str, arrays: dict):
+    # Files of older versions of the image are never used again
+    base, _ = os.path.splitext(map_path)
+    for stale in glob.glob(f"{glob.escape(base)}.*.npy"):
+        os.remove(stale)
+
+    for name in CACHE_ARRAYS:
+        path = cache_path(map_path, key, name)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.save(file, arrays[name])
+        # A crash halfway through never leaves a truncated file under the final name
+        os.replace(temporary, path)
+
+
+def load_walls(map_path: str = MAP_PATH) -> dict:
+    """
+    Get the wall geometry of a map, from the cache when it is up to date, otherwise generated and cached
+
+    Args:
+        map_path (str): path of the map image
+
+    Returns:
+        dict: walls.static_geometry arrays, memory-mapped when cached
+    """
+
+    key = cache_key(map_path)
+
+    try:
+        return {name: np.load(cache_path(map_path, key, name), mmap_mode="r") for name in CACHE_ARRAYS}
+    except (OSError, ValueError):
+        pass
+
+    arrays = build(map_path)
+
+    try:
+        save(map_path, key, arrays)
+    except OSError as e:
+        # Read-only install: still works, just without the faster startup
+        print(f"Could not cache map geometry: {e}")
+
+    return arrays
@@ -0,0 +1,364 @@
+"""
+Deterministic player movement step, shared by the client (prediction and replay) and the server (authoritative
+movement). Nothing in here depends on Ursina: level geometry is queried through a world object with a move_and_slide
+method that sweeps the player's box, and a raycast method that returns hits shaped like Ursina's HitInfo.
+"""
+
+import math
+import struct
+
+# How far below the feet a grounded player looks for the ground, so walking off a ledge is noticed
+GROUND_SNAP = 0.1
+# Extra speed boost each consecutive bunny hop adds, up to MovementParams.max_bhop_boost
+BHOP_BOOST_STEP = 0.1
+
+
+class MovementParams:
+    """
+    Movement tuning, with the same attribute names and defaults as FirstPersonController so either can be passed
+    to simulate
+    """
+
+    def __init__(self):
+        self.acceleration = 150
+        self.friction = 80
+        self.air_friction = 5
+        self.max_speed = 15
+        self.bhop_window = 0.2
+        self.bhop_boost = 1.5
+        self.max_bhop_boost = 2.0
+        self.air_control = 0.33
+        self.height = 2
+        self.radius = 0.5
+        self.gravity_value = 20
+        self.jump_height = 1.2
+        self.jump_initial_velocity = math.sqrt(2 * self.gravity_value * self.jump_height)
+
+
+def float32(value: float) -> float:
+    """
+    Round a float to single precision, the way it is sent over the network
+    """
+
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+class InputCommand:
+    """
+    Player input for one simulation step
+
+    Args:
+        sequence (int): increasing number identifying the command
+        dt (float): duration of the step in seconds
+        forward (int): 1 to move forward, -1 backwards, 0 to stand still
+        right (int): 1 to strafe right, -1 left, 0 not at all
+        yaw (float): rotation of the player around the y axis in degrees
+        jump (bool): whether the jump key was pressed
+    """
+
+    def __init__(self, sequence: int, dt: float, forward: int, right: int, yaw: float, jump: bool):
+        # Rounded like the binary encoding rounds them, so the server simulates exactly what the client predicted
+        self.sequence = sequence
+        self.dt = float32(dt)
+        self.forward = forward
+        self.right = right
+        self.yaw = float32(yaw)
+        self.jump = jump
+
+    def to_dict(self) -> dict:
+        return {
+            "object": "input",
+            "sequence": self.sequence,
+            "dt": self.dt,
+            "forward": self.forward,
+            "right": self.right,
+            "yaw": self.yaw,
+            "jump": self.jump
+        }
+
+    @staticmethod
+    def from_dict(info: dict):
+        return InputCommand(info["sequence"], info["dt"], info["forward"], info["right"], info["yaw"], info["jump"])
+
+
+class MovementState:
+    """
+    Everything simulate reads and writes about a player
+    """
+
+    def __init__(self, position=(0, 0, 0)):
+        self.position = list(position)
+        self.velocity = [0.0, 0.0, 0.0]
+        self.grounded = False
+        self.landing_time = 0
+        self.bhop_active = False
+        self.consecutive_bhops = 0
+        self.air_time = 0
+        # Simulation clock, advanced by the dt of every command so replays see the same timings
+        self.time = 0
+
+    def copy(self):
+        state = MovementState(self.position)
+        state.velocity = list(self.velocity)
+        state.grounded = self.grounded
+        state.landing_time = self.landing_time
+        state.bhop_active = self.bhop_active
+        state.consecutive_bhops = self.consecutive_bhops
+        state.air_time = self.air_time
+        state.time = self.time
+        return state
+
+    def to_dict(self, sequence: int) -> dict:
+        """
+        Args:
+            sequence (int): last input command applied to this state
+        """
+
+        return {
+            "object": "move_state",
+            "sequence": sequence,
+            "position": tuple(self.position),
+            "velocity": tuple(self.velocity),
+            "grounded": self.grounded,
+            "landing_time": self.landing_time,
+            "bhop_active": self.bhop_active,
+            "consecutive_bhops": self.consecutive_bhops,
+            "air_time": self.air_time,
+            "time": self.time
+        }
+
+    @staticmethod
+    def from_dict(info: dict):
+        state = MovementState(info["position"])
+        state.velocity = list(info["velocity"])
+        state.grounded = info["grounded"]
+        state.landing_time = info["landing_time"]
+        state.bhop_active = info["bhop_active"]
+        state.consecutive_bhops = info["consecutive_bhops"]
+        state.air_time = info["air_time"]
+        state.time = info["time"]
+        return state
+
+
+class RayHit:
+    """
+    Result of a world raycast, with the fields of Ursina's HitInfo that the movement code uses
+    """
+
+    def __init__(self, hit: bool, distance: float = math.inf, world_point=None, world_normal=None):
+        self.hit = hit
+        self.distance = distance
+        self.world_point = world_point
+        self.world_normal = world_normal
+
+
+class SlideResult:
+    """
+    Result of moving a box through a world
+
+    Args:
+        position (tuple): (x, y, z) where the box ended up
+        blocked (tuple): for each axis, whether the motion along it was cut short by something
+    """
+
+    def __init__(self, position, blocked=(False, False, False)):
+        self.position = position
+        self.blocked = blocked
+
+
+class FlatWorld:
+    """
+    Level made of nothing but an infinite ground plane, for simulating movement without the map
+    """
+
+    def __init__(self, ground_y: float = 0):
+        self.ground_y = ground_y
+
+    def raycast(self, origin, direction, distance: float = math.inf) -> RayHit:
+        if direction[1] >= 0 or origin[1] < self.ground_y:
+            return RayHit(False, distance)
+
+        hit_distance = (origin[1] - self.ground_y) / -direction[1]
+        if hit_distance > distance:
+            return RayHit(False, distance)
+
+        point = tuple(o + d * hit_distance for o, d in zip(origin, direction))
+        return RayHit(True, hit_distance, point, (0, 1, 0))
+
+    def move_and_slide(self, position, radius: float, height: float, motion) -> SlideResult:
+        x, y, z = (p + m for p, m in zip(position, motion))
+
+        if position[1] >= self.ground_y > y:
+            return SlideResult((x, self.ground_y, z), (False, True, False))
+
+        return SlideResult((x, y, z))
+
+
+def length(vector) -> float:
+    return math.sqrt(sum(component * component for component in vector))
+
+
+def normalized(vector) -> list:
+    vector_length = length(vector)
+    if vector_length == 0:
+        return list(vector)
+    return [component / vector_length for component in vector]
+
+
+def move_direction(cmd: InputCommand) -> list:
+    """
+    Normalized horizontal direction the player wants to move in, from the keys held and the player's rotation
+    """
+
+    yaw = math.radians(cmd.yaw)
+    forward = (math.sin(yaw), 0, math.cos(yaw))
+    right = (math.cos(yaw), 0, -math.sin(yaw))
+    return normalized([f * cmd.forward + r * cmd.right for f, r in zip(forward, right)])
+
+
+def land(state: MovementState):
+    state.air_time = 0
+    state.grounded = True
+    state.landing_time = state.time
+
+
+def jump(state: MovementState, direction, params):
+    if not state.grounded:
+        return
+
+    state.grounded = False
+    state.velocity[1] = params.jump_initial_velocity
+
+    horizontal_vel = [state.velocity[0], 0, state.velocity[2]]
+    horizontal_dir = normalized([direction[0], 0, direction[2]])
+
+    # Moving keys held: give an extra push in that direction, or strengthen the current one
+    if length(horizontal_dir) > 0:
+        if state.bhop_active:
+            boost_multiplier = min(params.bhop_boost + (state.consecutive_bhops * BHOP_BOOST_STEP), params.max_bhop_boost)
+        else:
+            boost_multiplier = 1.5
+
+        if length(horizontal_vel) > 0:
+            same_direction = sum(a * b for a, b in zip(normalized(horizontal_vel), horizontal_dir)) > 0.7
+
+            if same_direction:
+                boosted_vel = [component * boost_multiplier for component in horizontal_vel]
+                if length(boosted_vel) > params.max_speed * boost_multiplier:
+                    boosted_vel = [component * params.max_speed * boost_multiplier for component in normalized(boosted_vel)]
+            else:
+                boosted_vel = [component * params.max_speed * boost_multiplier for component in horizontal_dir]
+        else:
+            boosted_vel = [component * params.max_speed * boost_multiplier for component in horizontal_dir]
+
+        state.velocity[0] = boosted_vel[0]
+        state.velocity[2] = boosted_vel[2]
+
+
+def max_consecutive_bhops(params) -> int:
+    """
+    Number of consecutive bunny hops after which the boost stops growing
+    """
+
+    return max(0, math.ceil(round((params.max_bhop_boost - params.bhop_boost) / BHOP_BOOST_STEP, 6)))
+
+
+def simulate(state: MovementState, cmd: InputCommand, params, world) -> bool:
+    """
+    Advance a player's movement by one command. Running the same commands from the same state against the same
+    world always gives the same result.
+
+    Args:
+        state (MovementState): state to update in place
+        cmd (InputCommand): input for this step
+        params: MovementParams, or anything with the same attributes
+        world: level geometry, anything with a move_and_slide(position, radius, height, motion) method
+
+    Returns:
+        bool: whether the command's jump was used (it stays pending while the player is in the air)
+    """
+
+    dt = cmd.dt
+    state.time += dt
+    direction = move_direction(cmd)
+    jumped = False
+
+    if cmd.jump and state.grounded:
+        # Jumping again right after landing keeps the speed boost going
+        if state.time - state.landing_time < params.bhop_window:
+            state.bhop_active = True
+            # Hops past the one that reaches the highest boost don't count, so the counter stays small enough
+            # to send
+            state.consecutive_bhops = min(state.consecutive_bhops + 1, max_consecutive_bhops(params))
+
+        jump(state, direction, params)
+        jumped = True
+
+    if state.grounded and state.time - state.landing_time > params.bhop_window:
+        state.bhop_active = False
+        state.consecutive_bhops = 0
+
+    if length(direction) > 0:
+        acceleration_multiplier = params.acceleration
+
+        # Keys have less effect in the air
+        if not state.grounded and not state.bhop_active:
+            acceleration_multiplier = params.acceleration * params.air_control
+
+        for axis in range(3):
+            state.velocity[axis] += direction[axis] * acceleration_multiplier * dt
+
+    speed = length(state.velocity)
+    if speed > 0:
+        friction_strength = params.friction if state.grounded else params.air_friction
+        friction = friction_strength * dt
+
+        # Friction slows the player down but never reverses the direction of movement
+        if speed > friction:
+            for axis in range(3):
+                state.velocity[axis] -= state.velocity[axis] / speed * friction
+        else:
+            state.velocity = [0.0, 0.0, 0.0]
+
+    horizontal_speed = length((state.velocity[0], 0, state.velocity[2]))
+    if horizontal_speed > params.max_speed:
+        state.velocity[0] *= params.max_speed / horizontal_speed
+        state.velocity[2] *= params.max_speed / horizontal_speed
+
+    motion = [component * dt for component in state.velocity]
+
+    if params.gravity_value:
+        if state.grounded:
+            motion[1] -= GROUND_SNAP
+        else:
+            # In the air the vertical velocity moves the player both before and after gravity is applied, the
+            # jump height is tuned for it
+            state.velocity[1] -= params.gravity_value * dt
+            motion[1] += state.velocity[1] * dt
+
+    # The whole motion is swept at once, so fast players can't skip through thin walls and slide along them
+    result = world.move_and_slide(state.position, params.radius, params.height, motion)
+    state.position = list(result.position)
+
+    for axis in (0, 2):
+        if result.blocked[axis]:
+            state.velocity[axis] = 0
+
+    if params.gravity_value:
+        if result.blocked[1] and motion[1] < 0:
+            if not state.grounded:
+                land(state)
+            state.grounded = True
+            state.velocity[1] = 0
+        else:
+            state.grounded = False
+            state.air_time += dt
+            # Bumped into a ceiling
+            if result.blocked[1]:
+                state.velocity[1] = min(state.velocity[1], 0)
+
+    return jumped
+
+
+def positions_match(a, b, tolerance: float = 0.01) -> bool:
+    return all(abs(x - y) <= tolerance for x, y in zip(a, b))
@@ -1,10 +1,13 @@
 import socket
+import select
 import json
+import time
 import threading
+from collections import deque
 
-from player import Player
-from enemy import Enemy
-from bullet import Bullet
+from movement import InputCommand
+from protocol import (pack_frame, FrameBuffer, CODECS, CODEC_JSON, encode_message, decode_message, apply_delta,
+                      pack_datagram, unpack_datagram, ProtocolError, MAX_DATAGRAM_SIZE, TRANSPORT_UDP)
 
 
 class Network:
@@ -15,15 +18,51 @@ class Network:
         server_addr (str): IPv4 address of the server
         server_port (int): Port at which server is running
         username (str): Username of this client's player
+        codecs (tuple): Message encodings to offer the server, most preferred first
+        transport (str): "udp" to send movement and receive snapshots as datagrams when the server supports it,
+            "tcp" to keep everything on the stream
+        send_rate (float): Most writes per second; everything queued in between goes out together
+        nodelay (bool): Disable Nagle's algorithm, since messages are already coalesced before being written
+        room (str): Room to join when the server hosts several, any room with space if None
     """
 
-    def __init__(self, server_addr: str, server_port: int, username: str):
+    def __init__(self, server_addr: str, server_port: int, username: str, codecs: tuple = CODECS,
+                 transport: str = TRANSPORT_UDP, send_rate: float = 60, nodelay: bool = True, room: str = None):
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.addr = server_addr
         self.port = server_port
         self.username = username
+        self.room = room
         self.recv_size = 2048
         self.id = 0
+        self.codecs = codecs
+        self.codec = CODEC_JSON
+        self.tick_rate = 30
+        # Whether the server simulates movement from input commands
+        self.authoritative = False
+        self.frames = FrameBuffer()
+        self.pending = deque()
+        # Reconstructed world states by tick, kept as baselines for the server's delta snapshots
+        self.snapshots = {}
+        self.last_tick = 0
+        # Estimated difference between the server clock (tick / tick_rate) and time.perf_counter()
+        self.clock_offset = None
+        self.transport = transport
+        self.udp = None
+        self.token = 0
+        self.udp_sequence = 0
+        self.udp_last_sequence = 0
+        # Messages waiting for the next network tick: every reliable one in order, only the latest unreliable one
+        # of each kind
+        self.send_rate = send_rate
+        self.outbox = []
+        self.latest = {}
+        self.outbox_lock = threading.Lock()
+        self.sender = None
+        self.closed = False
+
+        if nodelay:
+            self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def settimeout(self, value):
         self.client.settimeout(value)
@@ -34,29 +73,239 @@ class Network:
         """
 
         self.client.connect((self.addr, self.port))
-        self.id = self.client.recv(self.recv_size).decode("utf8")
-        self.client.send(self.username.encode("utf8"))
 
-    def receive_info(self):
-        try:
+        # Said before the id arrives, so a lobby can pick the room from it
+        hello = {"username": self.username, "codecs": list(self.codecs)}
+        if self.room is not None:
+            hello["room"] = self.room
+        self.client.sendall(pack_frame(json.dumps(hello).encode("utf8")))
+
+        identifier = self.receive_frame()
+        if identifier is None:
+            # Server hung up straight away, most likely because it is full
+            raise ConnectionRefusedError("Server closed the connection")
+
+        self.id = identifier.decode("utf8")
+
+        # The server answers with the encoding it picked out of the ones offered
+        welcome = self.receive_frame()
+        if welcome is None:
+            raise ConnectionRefusedError("Server closed the connection")
+        welcome = json.loads(welcome.decode("utf8"))
+        self.codec = welcome["codec"]
+        self.tick_rate = welcome.get("tick_rate", self.tick_rate)
+        self.authoritative = welcome.get("authoritative", False)
+        self.room = welcome.get("room", self.room)
+
+        if self.transport == TRANSPORT_UDP and "udp_port" in welcome:
+            self.token = welcome["token"]
+            self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp.connect((self.addr, welcome["udp_port"]))
+            # Lets the server learn which address to send snapshots to
+            self.send_unreliable(encode_message({"object": "ack", "tick": 0}, self.codec), "ack")
+
+        self.sender = threading.Thread(target=self.send_loop, daemon=True)
+        self.sender.start()
+
+    def receive_frame(self):
+        """
+        Get the next complete frame from the server, reading from the socket only when none is buffered
+
+        Returns:
+            bytes: payload of the frame, or None if the server closed the connection
+        """
+
+        while not self.pending:
+            if self.udp is not None:
+                readable, _, _ = select.select([self.client, self.udp], [], [])
+                if self.udp in readable:
+                    self.receive_datagram()
+                if self.client not in readable:
+                    continue
+
             msg = self.client.recv(self.recv_size)
-        except socket.error as e:
-            print(e)
+            if not msg:
+                return None
+            self.pending.extend(self.frames.feed(msg))
+
+        return self.pending.popleft()
+
+    def receive_datagram(self):
+        """
+        Read one datagram from the server, queueing its payload unless it is stale or not meant for this client
+        """
+
+        try:
+            data = self.udp.recv(MAX_DATAGRAM_SIZE)
+            _, token, sequence, payload = unpack_datagram(data)
+        except (socket.error, ProtocolError) as e:
+            if not self.closed:
+                print(e)
+            return
+
+        # Datagrams can arrive out of order, anything older than what's already been received is outdated
+        if token != self.token or sequence <= self.udp_last_sequence:
+            return
+
+        self.udp_last_sequence = sequence
+        self.pending.append(payload)
+
+    def receive_info(self):
+        msg = self.receive_frame()
 
         if not msg:
             return None
 
-        msg_decoded = msg.decode("utf8")
+        info = decode_message(msg)
+
+        if info["object"] == "snapshot":
+            return self.apply_snapshot(info)
+
+        return info
+
+    def apply_snapshot(self, info: dict):
+        """
+        Rebuild the full world state out of a delta snapshot and acknowledge it, so the server can use it as the
+        baseline for the following ones
+
+        Args:
+            info (dict): decoded snapshot holding only what changed since its baseline
+
+        Returns:
+            dict: snapshot holding the full state of every player, empty if the baseline is unknown
+        """
+
+        baseline_tick = info["baseline"]
+        if baseline_tick:
+            baseline = self.snapshots.get(baseline_tick)
+        else:
+            baseline = {}
+
+        if baseline is None or info["tick"] <= self.last_tick:
+            return {"object": "snapshot", "tick": info["tick"], "players": []}
+        self.last_tick = info["tick"]
+        self.sync_clock(info["tick"] / self.tick_rate)
+
+        states = apply_delta(baseline, info["players"], info["removed"])
+        self.snapshots[info["tick"]] = states
+
+        # The server never goes back to a baseline older than the one it just used
+        for old_tick in list(self.snapshots):
+            if old_tick >= baseline_tick:
+                break
+            del self.snapshots[old_tick]
+
+        self.send_unreliable(encode_message({"object": "ack", "tick": info["tick"]}, self.codec), "ack")
+
+        return {
+            "object": "snapshot",
+            "tick": info["tick"],
+            "players": [{"id": identifier, **state} for identifier, state in states.items()]
+        }
+
+    def sync_clock(self, server_time: float):
+        """
+        Update the estimate of the server clock with the time a snapshot was taken at. Snapshots that arrive
+        early move the estimate forward straight away, late ones only pull it back slowly, so network jitter
+        doesn't make the clock jump around.
+        """
+
+        offset = server_time - time.perf_counter()
+
+        if self.clock_offset is None or offset > self.clock_offset:
+            self.clock_offset = offset
+        else:
+            self.clock_offset += (offset - self.clock_offset) * 0.01
+
+    def server_time(self) -> float:
+        """
+        Returns:
+            float: current server time in seconds, as estimated from received snapshots
+        """
+
+        return time.perf_counter() + (self.clock_offset or 0)
+
+    def send(self, payload: bytes):
+        """
+        Queue a message to be delivered reliably and in order with the next network tick
+
+        Args:
+            payload (bytes): encoded message to send
+        """
+
+        with self.outbox_lock:
+            self.outbox.append(payload)
 
-        left_bracket_index = msg_decoded.index("{")
-        right_bracket_index = msg_decoded.index("}") + 1
-        msg_decoded = msg_decoded[left_bracket_index:right_bracket_index]
+    def send_unreliable(self, payload: bytes, kind: str):
+        """
+        Queue a message that a newer one will supersede. Only the latest message of each kind is sent with the
+        next network tick, as a datagram if the server accepted UDP.
 
-        msg_json = json.loads(msg_decoded)
+        Args:
+            payload (bytes): encoded message to send
+            kind (str): what the message is about, a newer message of the same kind replaces this one
+        """
 
-        return msg_json
+        with self.outbox_lock:
+            self.latest[kind] = payload
+
+    def send_loop(self):
+        """
+        Sender thread: writes everything queued since the previous tick, at most send_rate times per second
+        """
+
+        interval = 1 / self.send_rate
+
+        while not self.closed:
+            started = time.perf_counter()
+            self.flush()
+            time.sleep(max(0, interval - (time.perf_counter() - started)))
+
+    def flush(self):
+        """
+        Write all queued messages: reliable ones (and unreliable ones without UDP) in a single write to the stream
+        """
+
+        with self.outbox_lock:
+            reliable, self.outbox = self.outbox, []
+            unreliable, self.latest = list(self.latest.values()), {}
+
+        if self.udp is None:
+            reliable += unreliable
+            unreliable = []
+
+        try:
+            if reliable:
+                self.client.sendall(b"".join(pack_frame(payload) for payload in reliable))
+
+            for payload in unreliable:
+                self.udp_sequence += 1
+                self.udp.send(pack_datagram(int(self.id), self.token, self.udp_sequence, payload))
+        except socket.error as e:
+            # Sockets closed by close while writing
+            if not self.closed:
+                print(e)
+
+    def close(self):
+        """
+        Leave the server, stopping the sender thread. Messages still queued are sent first.
+        """
+
+        self.closed = True
+        if self.sender is not None:
+            self.sender.join()
+        self.flush()
+
+        self.client.close()
+        if self.udp is not None:
+            self.udp.close()
+
+    def send_player(self, player):
+        """
+        Args:
+            player: the local player, anything with world_x, world_y, world_z, rotation_y and health
+        """
 
-    def send_player(self, player: Player):
         player_info = {
             "object": "player",
             "id": self.id,
@@ -66,39 +315,45 @@ class Network:
             "joined": False,
             "left": False
         }
-        player_info_encoded = json.dumps(player_info).encode("utf8")
+        self.send_unreliable(encode_message(player_info, self.codec), "player")
 
-        try:
-            self.client.send(player_info_encoded)
-        except socket.error as e:
-            print(e)
+    def send_input(self, cmd: InputCommand):
+        self.send(encode_message(cmd.to_dict(), self.codec))
+
+    def send_bullet(self, position, direction: float, x_direction: float, damage: int):
+        """
+        Args:
+            position: (x, y, z) where the bullet is fired from
+            direction (float): rotation around the y axis in degrees
+            x_direction (float): rotation around the x axis in degrees
+            damage (int): damage done to the player hit
+        """
 
-    def send_bullet(self, bullet: Bullet):
         bullet_info = {
             "object": "bullet",
-            "position": (bullet.world_x, bullet.world_y, bullet.world_z),
-            "damage": bullet.damage,
-            "direction": bullet.direction,
-            "x_direction": bullet.x_direction
+            "position": tuple(position),
+            "damage": damage,
+            "direction": direction,
+            "x_direction": x_direction
         }
 
-        bullet_info_encoded = json.dumps(bullet_info).encode("utf8")
+        self.send(encode_message(bullet_info, self.codec))
 
-        try:
-            self.client.send(bullet_info_encoded)
-        except socket.error as e:
-            print(e)
+    def send_fire(self, origin, direction, tick: float):
+        """
+        Ask the server to check a shot, it replies with a health_update if a player was hit
 
-    def send_health(self, player: Enemy):
-        health_info = {
-            "object": "health_update",
-            "id": player.id,
-            "health": player.health
-        }
+        Args:
+            origin: (x, y, z) start of the shot
+            direction: (x, y, z) direction of the shot
+            tick (float): server tick the other players were being drawn at when the shot was fired
+        """
 
-        health_info_encoded = json.dumps(health_info).encode("utf8")
+        fire_info = {
+            "object": "fire",
+            "origin": tuple(origin),
+            "direction": tuple(direction),
+            "tick": tick
+        }
 
-        try:
-            self.client.send(health_info_encoded)
-        except socket.error as e:
-            print(e)
+        self.send(encode_message(fire_info, self.codec))
@@ -0,0 +1,62 @@
+import ursina
+
+
+class ParticlePool(ursina.Entity):
+    """
+    Short-lived effect particles, all created up front and recycled. Emitting reuses a hidden particle instead of
+    creating an entity, and the pool animates every live particle itself instead of one animation per particle.
+    When every particle is alive, the oldest one is reused.
+
+    Args:
+        size (int): number of particles
+        lifetime (float): seconds a particle stays visible
+        model (str): model of the particles
+        start_scale (float): scale when emitted
+        end_scale (float): scale at the end of its life
+        start_color: color when emitted
+        end_color: color at the end of its life
+    """
+
+    def __init__(self, size: int, lifetime: float, model: str, start_scale: float, end_scale: float, start_color, end_color):
+        super().__init__()
+
+        self.lifetime = lifetime
+        self.start_scale = start_scale
+        self.end_scale = end_scale
+        self.start_color = start_color
+        self.end_color = end_color
+
+        self.particles = [
+            ursina.Entity(parent=self, model=model, color=start_color, scale=start_scale, billboard=True, enabled=False)
+            for _ in range(size)
+        ]
+        self.ages = [0.0] * size
+        self.alive = set()
+        self.next_particle = 0
+
+    def emit(self, position: ursina.Vec3):
+        index = self.next_particle
+        self.next_particle = (self.next_particle + 1) % len(self.particles)
+
+        particle = self.particles[index]
+        particle.world_position = position
+        particle.scale = self.start_scale
+        particle.color = self.start_color
+        particle.enabled = True
+
+        self.ages[index] = 0.0
+        self.alive.add(index)
+
+    def update(self):
+        for index in list(self.alive):
+            self.ages[index] += ursina.time.dt
+            particle = self.particles[index]
+
+            if self.ages[index] >= self.lifetime:
+                particle.enabled = False
+                self.alive.discard(index)
+                continue
+
+            t = self.ages[index] / self.lifetime
+            particle.scale = ursina.lerp(self.start_scale, self.end_scale, t)
+            particle.color = ursina.lerp(self.start_color, self.end_color, t)
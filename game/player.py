@@ -4,9 +4,10 @@ from weapon import Weapon
 
 
 class Player(FirstPersonController):
-    def __init__(self, position: ursina.Vec3):
+    def __init__(self, position: ursina.Vec3, world=None):
         super().__init__(
             position=position,
+            world=world,
             model="cube",
             jump_height=2.5,
             jump_duration=0.4,
@@ -61,12 +62,14 @@ class Player(FirstPersonController):
 
     def death(self):
         self.death_message_shown = True
+        # Сервер не знает о телепорте после смерти, его коррекции вернули бы игрока на место гибели
+        self.stop_commands()
 
         for i in self.inventory:
             ursina.destroy(i)
         self.rotation = 0
         self.camera_pivot.world_rotation_x = -45
-        self.world_position = ursina.Vec3(0, 7, -35)
+        self.teleport(ursina.Vec3(0, 7, -35))
         self.cursor.color = ursina.color.rgba(0, 0, 0, 0)
 
         ursina.Text(
@@ -90,7 +93,7 @@ class Player(FirstPersonController):
                 0
             )
         else:
-            remaining_time = self.bhop_window - (ursina.time.time() - self.landing_time)
+            remaining_time = self.bhop_window - (self.sim_time - self.landing_time)
             if self.grounded and remaining_time > 0:
                 self.bhop_indicator.text = f"BHOP READY {remaining_time:.2f}s"
                 self.bhop_indicator.color = ursina.color.yellow
@@ -115,8 +118,7 @@ class Player(FirstPersonController):
             self.camera_pivot.y = self.height * 0.75
         else:
             # Check if there's room to stand up
-            head_ray = ursina.raycast(self.position+ursina.Vec3(0,self.height*0.75,0), self.up, 
-                             distance=self.height * 0.25,
-                             traverse_target=self.traverse_target, ignore=self.ignore_list)
+            head_ray = self.world.raycast(self.position+ursina.Vec3(0,self.height*0.75,0), (0, 1, 0),
+                             distance=self.height * 0.25)
             if not head_ray.hit:
                 self.camera_pivot.y = self.height
\ No newline at end of file
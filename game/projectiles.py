@@ -0,0 +1,103 @@
+"""
+Bullet flight without Ursina: bullets live in preallocated arrays and are moved together, so the client's
+ProjectileManager and the server's Simulation step them the same way
+"""
+
+import numpy as np
+
+from collision import segments_hit_boxes
+
+BULLET_SPEED = 35
+BULLET_LIFETIME = 2
+
+
+def bullet_velocity(direction: float, x_direction: float) -> np.ndarray:
+    """
+    Velocity of a bullet fired with a rotation around the y axis (direction) and the x axis (x_direction), in
+    degrees
+    """
+
+    dir_rad = np.radians(direction)
+    x_dir_rad = np.radians(x_direction)
+
+    return np.array((
+        np.sin(dir_rad) * np.cos(x_dir_rad),
+        np.sin(x_dir_rad),
+        np.cos(dir_rad) * np.cos(x_dir_rad)
+    )) * BULLET_SPEED
+
+
+class Projectiles:
+    """
+    Every bullet in flight. Each step sweeps the segment every bullet travels against the level and the players,
+    so fast bullets can't pass through anything.
+
+    Args:
+        size (int): most bullets in flight, the oldest one is recycled when a new one doesn't fit
+    """
+
+    def __init__(self, size: int = 128):
+        self.positions = np.zeros((size, 3))
+        self.velocities = np.zeros((size, 3))
+        self.ages = np.zeros(size)
+        self.alive = np.zeros(size, dtype=bool)
+        self.next_bullet = 0
+
+    def spawn(self, position, direction: float, x_direction: float) -> int:
+        """
+        Fire a bullet
+
+        Args:
+            position: (x, y, z) where it is fired from
+            direction (float): rotation around the y axis in degrees
+            x_direction (float): rotation around the x axis in degrees
+
+        Returns:
+            int: slot of the bullet
+        """
+
+        free = np.flatnonzero(~self.alive)
+        if len(free):
+            index = free[0]
+        else:
+            index = self.next_bullet
+            self.next_bullet = (self.next_bullet + 1) % len(self.alive)
+
+        velocity = bullet_velocity(direction, x_direction)
+        self.velocities[index] = velocity
+        self.positions[index] = np.array(tuple(position)) + velocity / BULLET_SPEED
+        self.ages[index] = 0
+        self.alive[index] = True
+        return index
+
+    def step(self, dt: float, world, target_mins: np.ndarray, target_maxs: np.ndarray) -> np.ndarray:
+        """
+        Move every bullet, stopping the ones that hit something or are too old
+
+        Args:
+            dt (float): duration of the step in seconds
+            world: level geometry, a collision.StaticCollisionWorld
+            target_mins (np.ndarray): lowest corners of the players' boxes, of shape (players, 3)
+            target_maxs (np.ndarray): highest corners of the players' boxes, of shape (players, 3)
+
+        Returns:
+            np.ndarray: slots of the bullets that stopped
+        """
+
+        indices = np.flatnonzero(self.alive)
+        if not len(indices):
+            return indices
+
+        starts = self.positions[indices]
+        ends = starts + self.velocities[indices] * dt
+
+        wall_fractions = world.segments_hit(starts, ends)
+        target_fractions, _ = segments_hit_boxes(starts, ends, target_mins, target_maxs)
+
+        self.positions[indices] = ends
+        self.ages[indices] += dt
+
+        # Bullets stop at the first wall or player in their way
+        finished = np.isfinite(wall_fractions) | np.isfinite(target_fractions) | (self.ages[indices] >= BULLET_LIFETIME)
+        self.alive[indices[finished]] = False
+        return indices[finished]
@@ -0,0 +1,489 @@
+"""
+Wire protocol shared by the client and the server.
+
+Every message on the stream is a frame: a 4 byte big-endian payload length followed by the payload itself.
+Payloads are either compact struct-packed messages starting with a numeric tag, or JSON objects for clients
+that negotiated the JSON fallback when joining.
+
+Movement updates, snapshots and their acknowledgements can instead travel as UDP datagrams, each carrying a
+single payload behind a small header with the sender's id, a per-player token and a sequence number.
+"""
+
+import json
+import struct
+
+HEADER = struct.Struct("!I")
+# Frames larger than this are treated as a corrupted stream
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+# sender id (0 for the server), token handed out when joining, sequence number
+DATAGRAM_HEADER = struct.Struct("<HII")
+# Largest datagram either side will try to read
+MAX_DATAGRAM_SIZE = 65507
+
+TRANSPORT_TCP = "tcp"
+TRANSPORT_UDP = "udp"
+# Messages that may be sent over the unreliable channel, because newer ones supersede older ones
+UNRELIABLE_OBJECTS = ("player", "snapshot", "ack", "move_state")
+
+
+class ProtocolError(Exception):
+    """
+    Raised when the byte stream can't be split into valid frames
+    """
+
+
+def pack_frame(payload: bytes) -> bytes:
+    """
+    Prefix a payload with its length
+
+    Args:
+        payload (bytes): message to send
+
+    Returns:
+        bytes: the framed message, ready to be written to a socket
+    """
+
+    return HEADER.pack(len(payload)) + payload
+
+
+def pack_datagram(identifier: int, token: int, sequence: int, payload: bytes) -> bytes:
+    """
+    Prefix a payload with the datagram header
+
+    Args:
+        identifier (int): id of the sending player, 0 for the server
+        token (int): token the server handed to the player when it joined
+        sequence (int): increasing number used to drop stale and duplicated datagrams
+        payload (bytes): message to send
+
+    Returns:
+        bytes: the datagram
+    """
+
+    return DATAGRAM_HEADER.pack(identifier, token, sequence) + payload
+
+
+def unpack_datagram(data: bytes):
+    """
+    Split a datagram into its header fields and payload
+
+    Args:
+        data (bytes): received datagram
+
+    Returns:
+        tuple: sender id, token, sequence number and payload
+    """
+
+    if len(data) <= DATAGRAM_HEADER.size:
+        raise ProtocolError(f"Datagram of {len(data)} bytes is too short")
+
+    identifier, token, sequence = DATAGRAM_HEADER.unpack_from(data)
+    return identifier, token, sequence, data[DATAGRAM_HEADER.size:]
+
+
+class FrameBuffer:
+    """
+    Streaming reassembly buffer: collects raw bytes as they come off a socket and splits them into complete frames,
+    however the stream happened to be chunked by TCP.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """
+        Append received bytes to the buffer
+
+        Args:
+            data (bytes): bytes read from the socket
+
+        Returns:
+            list: payloads of every frame completed by this data, in order
+        """
+
+        self.buffer += data
+        frames = []
+        offset = 0
+
+        while len(self.buffer) - offset >= HEADER.size:
+            (size,) = HEADER.unpack_from(self.buffer, offset)
+            if size > MAX_FRAME_SIZE:
+                raise ProtocolError(f"Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+
+            end = offset + HEADER.size + size
+            if end > len(self.buffer):
+                break
+
+            frames.append(bytes(self.buffer[offset + HEADER.size:end]))
+            offset = end
+
+        del self.buffer[:offset]
+        return frames
+
+
+# Message encodings, in order of preference. The client offers the ones it supports when joining and the server picks one.
+CODEC_BINARY = "binary"
+CODEC_JSON = "json"
+CODECS = (CODEC_BINARY, CODEC_JSON)
+
+# Numeric tags identifying binary messages. JSON payloads always start with "{", which never collides with a tag.
+MSG_PLAYER = 1
+MSG_JOIN = 2
+MSG_LEAVE = 3
+MSG_BULLET = 4
+MSG_HEALTH = 5
+MSG_SNAPSHOT = 6
+MSG_ACK = 7
+MSG_INPUT = 8
+MSG_MOVE_STATE = 9
+MSG_FIRE = 10
+
+# tag, id, position, rotation, health
+PLAYER_STRUCT = struct.Struct("<BH3ffh")
+# tag, id, position, health, followed by the utf8 username
+JOIN_STRUCT = struct.Struct("<BH3fh")
+# tag, id
+LEAVE_STRUCT = struct.Struct("<BH")
+# tag, position, damage, direction, x_direction
+BULLET_STRUCT = struct.Struct("<B3fhff")
+# tag, id, health
+HEALTH_STRUCT = struct.Struct("<BHh")
+# tag, tick, baseline tick (0 for a full snapshot), number of players, followed by that many entries
+SNAPSHOT_STRUCT = struct.Struct("<BIIH")
+# id, bitmask of the fields that follow
+SNAPSHOT_ENTRY_STRUCT = struct.Struct("<HB")
+# number of players removed since the baseline, followed by that many ids
+REMOVED_STRUCT = struct.Struct("<H")
+ID_STRUCT = struct.Struct("<H")
+# tag, acknowledged snapshot tick
+ACK_STRUCT = struct.Struct("<BI")
+# tag, sequence, dt, forward, right, yaw, jump
+INPUT_STRUCT = struct.Struct("<BIfbbf?")
+# tag, last applied input sequence, position, velocity, grounded, landing time, bhop active, consecutive bhops,
+# air time, simulation time
+MOVE_STATE_STRUCT = struct.Struct("<BI3f3f?d?Bfd")
+# tag, origin, direction, server tick the shooter was seeing (fractional, enemies are drawn between ticks)
+FIRE_STRUCT = struct.Struct("<B3f3fd")
+
+# Fields of a player's state that can appear in a snapshot entry, with their bit in the entry mask and their layout
+SNAPSHOT_FIELDS = (
+    ("position", 1, struct.Struct("<3f")),
+    ("rotation", 2, struct.Struct("<f")),
+    ("health", 4, struct.Struct("<h"))
+)
+
+
+def choose_codec(offered) -> str:
+    """
+    Pick the encoding to use with a client
+
+    Args:
+        offered (list): codecs supported by the client, most preferred first
+
+    Returns:
+        str: the first offered codec this side understands, falling back to JSON
+    """
+
+    for codec in offered:
+        if codec in CODECS:
+            return codec
+    return CODEC_JSON
+
+
+def diff_states(baseline: dict, current: dict):
+    """
+    Work out what changed between two world states
+
+    Args:
+        baseline (dict): player id -> state dict, as last acknowledged by the client
+        current (dict): player id -> state dict, as it is now
+
+    Returns:
+        tuple: list of entries holding the id plus only the fields that changed, and list of ids no longer present
+    """
+
+    changed = []
+
+    for identifier, state in current.items():
+        old_state = baseline.get(identifier)
+        if old_state is None:
+            changed.append({"id": identifier, **state})
+            continue
+
+        entry = {"id": identifier}
+        for field, _, _ in SNAPSHOT_FIELDS:
+            if state[field] != old_state[field]:
+                entry[field] = state[field]
+        if len(entry) > 1:
+            changed.append(entry)
+
+    removed = [identifier for identifier in baseline if identifier not in current]
+
+    return changed, removed
+
+
+def apply_delta(baseline: dict, changed: list, removed: list) -> dict:
+    """
+    Rebuild a full world state from a baseline and a delta produced by diff_states
+
+    Args:
+        baseline (dict): player id -> state dict the delta was computed against
+        changed (list): entries holding an id plus the fields that changed
+        removed (list): ids no longer present
+
+    Returns:
+        dict: player id -> state dict
+    """
+
+    states = {identifier: state for identifier, state in baseline.items() if identifier not in removed}
+
+    for entry in changed:
+        state = dict(states.get(entry["id"], ()))
+        state.update((field, value) for field, value in entry.items() if field != "id")
+        states[entry["id"]] = state
+
+    return states
+
+
+def encode_snapshot_entry(entry: dict, codec: str = CODEC_BINARY) -> bytes:
+    """
+    Serialize the changed fields of one player for inclusion in a snapshot
+
+    Args:
+        entry (dict): player id plus any of position, rotation and health
+        codec (str): encoding to use
+
+    Returns:
+        bytes: the encoded entry, to be passed to encode_snapshot
+    """
+
+    if codec == CODEC_JSON:
+        return json.dumps(entry).encode("utf8")
+
+    mask = 0
+    fields = []
+
+    for field, bit, layout in SNAPSHOT_FIELDS:
+        if field in entry:
+            mask |= bit
+            value = entry[field]
+            if field == "position":
+                fields.append(layout.pack(*value))
+            elif field == "health":
+                fields.append(layout.pack(round(value)))
+            else:
+                fields.append(layout.pack(value))
+
+    return SNAPSHOT_ENTRY_STRUCT.pack(int(entry["id"]), mask) + b"".join(fields)
+
+
+def encode_snapshot(tick: int, baseline: int, entries: list, removed: list, codec: str = CODEC_BINARY) -> bytes:
+    """
+    Assemble a world-state snapshot out of pre-encoded entries, so entries shared between clients are only encoded once
+
+    Args:
+        tick (int): server tick the snapshot was taken at
+        baseline (int): tick of the snapshot the entries are relative to, 0 if they hold the full state
+        entries (list): entries produced by encode_snapshot_entry with the same codec
+        removed (list): ids of players present in the baseline but not anymore
+        codec (str): encoding to use
+
+    Returns:
+        bytes: the encoded payload (not yet framed)
+    """
+
+    if codec == CODEC_JSON:
+        return (
+            b'{"object": "snapshot", "tick": %d, "baseline": %d, "players": [' % (tick, baseline)
+            + b", ".join(entries)
+            + b'], "removed": ' + json.dumps(removed).encode("utf8") + b"}"
+        )
+
+    return (
+        SNAPSHOT_STRUCT.pack(MSG_SNAPSHOT, tick, baseline, len(entries))
+        + b"".join(entries)
+        + REMOVED_STRUCT.pack(len(removed))
+        + b"".join(ID_STRUCT.pack(int(identifier)) for identifier in removed)
+    )
+
+
+def encode_message(msg: dict, codec: str = CODEC_BINARY) -> bytes:
+    """
+    Serialize a message dictionary
+
+    Args:
+        msg (dict): the message, in the same shape the JSON protocol uses
+        codec (str): encoding to use
+
+    Returns:
+        bytes: the encoded payload (not yet framed)
+    """
+
+    if codec == CODEC_JSON:
+        return json.dumps(msg).encode("utf8")
+
+    kind = msg["object"]
+
+    if kind == "player":
+        if msg.get("joined"):
+            return JOIN_STRUCT.pack(MSG_JOIN, int(msg["id"]), *msg["position"], round(msg["health"])) + msg["username"].encode("utf8")
+        if msg.get("left"):
+            return LEAVE_STRUCT.pack(MSG_LEAVE, int(msg["id"]))
+        return PLAYER_STRUCT.pack(MSG_PLAYER, int(msg["id"]), *msg["position"], msg["rotation"], round(msg["health"]))
+
+    if kind == "bullet":
+        return BULLET_STRUCT.pack(MSG_BULLET, *msg["position"], round(msg["damage"]), msg["direction"], msg["x_direction"])
+
+    if kind == "health_update":
+        return HEALTH_STRUCT.pack(MSG_HEALTH, int(msg["id"]), round(msg["health"]))
+
+    if kind == "snapshot":
+        entries = [encode_snapshot_entry(entry) for entry in msg["players"]]
+        return encode_snapshot(msg["tick"], msg.get("baseline", 0), entries, msg.get("removed", []))
+
+    if kind == "ack":
+        return ACK_STRUCT.pack(MSG_ACK, msg["tick"])
+
+    if kind == "input":
+        return INPUT_STRUCT.pack(MSG_INPUT, msg["sequence"], msg["dt"], msg["forward"], msg["right"], msg["yaw"], msg["jump"])
+
+    if kind == "move_state":
+        return MOVE_STATE_STRUCT.pack(
+            MSG_MOVE_STATE, msg["sequence"], *msg["position"], *msg["velocity"], msg["grounded"], msg["landing_time"],
+            msg["bhop_active"], msg["consecutive_bhops"], msg["air_time"], msg["time"]
+        )
+
+    if kind == "fire":
+        return FIRE_STRUCT.pack(MSG_FIRE, *msg["origin"], *msg["direction"], msg["tick"])
+
+    # Anything without a binary layout still goes through as JSON
+    return json.dumps(msg).encode("utf8")
+
+
+def decode_message(payload: bytes) -> dict:
+    """
+    Deserialize a payload produced by encode_message with any codec
+
+    Args:
+        payload (bytes): the received frame
+
+    Returns:
+        dict: the message, in the same shape the JSON protocol uses
+    """
+
+    tag = payload[0]
+
+    if tag == ord("{"):
+        return json.loads(payload.decode("utf8"))
+
+    try:
+        if tag == MSG_PLAYER:
+            _, identifier, x, y, z, rotation, health = PLAYER_STRUCT.unpack(payload)
+            return {
+                "object": "player",
+                "id": str(identifier),
+                "position": (x, y, z),
+                "rotation": rotation,
+                "health": health,
+                "joined": False,
+                "left": False
+            }
+
+        if tag == MSG_JOIN:
+            _, identifier, x, y, z, health = JOIN_STRUCT.unpack_from(payload)
+            return {
+                "object": "player",
+                "id": str(identifier),
+                "username": payload[JOIN_STRUCT.size:].decode("utf8"),
+                "position": (x, y, z),
+                "health": health,
+                "joined": True,
+                "left": False
+            }
+
+        if tag == MSG_LEAVE:
+            _, identifier = LEAVE_STRUCT.unpack(payload)
+            return {"object": "player", "id": str(identifier), "joined": False, "left": True}
+
+        if tag == MSG_BULLET:
+            _, x, y, z, damage, direction, x_direction = BULLET_STRUCT.unpack(payload)
+            return {
+                "object": "bullet",
+                "position": (x, y, z),
+                "damage": damage,
+                "direction": direction,
+                "x_direction": x_direction
+            }
+
+        if tag == MSG_HEALTH:
+            _, identifier, health = HEALTH_STRUCT.unpack(payload)
+            return {"object": "health_update", "id": str(identifier), "health": health}
+
+        if tag == MSG_SNAPSHOT:
+            _, tick, baseline, count = SNAPSHOT_STRUCT.unpack_from(payload)
+            offset = SNAPSHOT_STRUCT.size
+            entries = []
+
+            for _ in range(count):
+                identifier, mask = SNAPSHOT_ENTRY_STRUCT.unpack_from(payload, offset)
+                offset += SNAPSHOT_ENTRY_STRUCT.size
+                entry = {"id": str(identifier)}
+
+                for field, bit, layout in SNAPSHOT_FIELDS:
+                    if mask & bit:
+                        value = layout.unpack_from(payload, offset)
+                        offset += layout.size
+                        entry[field] = value if field == "position" else value[0]
+
+                entries.append(entry)
+
+            (removed_count,) = REMOVED_STRUCT.unpack_from(payload, offset)
+            offset += REMOVED_STRUCT.size
+            removed = [
+                str(ID_STRUCT.unpack_from(payload, offset + index * ID_STRUCT.size)[0])
+                for index in range(removed_count)
+            ]
+
+            return {"object": "snapshot", "tick": tick, "baseline": baseline, "players": entries, "removed": removed}
+
+        if tag == MSG_ACK:
+            _, tick = ACK_STRUCT.unpack(payload)
+            return {"object": "ack", "tick": tick}
+
+        if tag == MSG_INPUT:
+            _, sequence, dt, forward, right, yaw, jump = INPUT_STRUCT.unpack(payload)
+            return {
+                "object": "input",
+                "sequence": sequence,
+                "dt": dt,
+                "forward": forward,
+                "right": right,
+                "yaw": yaw,
+                "jump": jump
+            }
+
+        if tag == MSG_MOVE_STATE:
+            (_, sequence, x, y, z, vx, vy, vz, grounded, landing_time, bhop_active, consecutive_bhops,
+             air_time, sim_time) = MOVE_STATE_STRUCT.unpack(payload)
+            return {
+                "object": "move_state",
+                "sequence": sequence,
+                "position": (x, y, z),
+                "velocity": (vx, vy, vz),
+                "grounded": grounded,
+                "landing_time": landing_time,
+                "bhop_active": bhop_active,
+                "consecutive_bhops": consecutive_bhops,
+                "air_time": air_time,
+                "time": sim_time
+            }
+
+        if tag == MSG_FIRE:
+            _, x, y, z, dx, dy, dz, tick = FIRE_STRUCT.unpack(payload)
+            return {"object": "fire", "origin": (x, y, z), "direction": (dx, dy, dz), "tick": tick}
+    except struct.error as e:
+        raise ProtocolError(f"Malformed message with tag {tag}: {e}")
+
+    raise ProtocolError(f"Unknown message tag {tag}")
@@ -0,0 +1,28 @@
+class EntityRegistry:
+    """
+    Networked entities indexed by their identifier, so message handlers find them in constant time.
+    Entities add themselves when created and remove themselves when destroyed.
+    """
+
+    def __init__(self):
+        self.entities = {}
+
+    def add(self, entity):
+        self.entities[entity.id] = entity
+
+    def remove(self, entity):
+        # Only forget the entity if its id hasn't been reused by a newer one
+        if self.entities.get(entity.id) is entity:
+            del self.entities[entity.id]
+
+    def get(self, identifier: str):
+        return self.entities.get(identifier)
+
+    def __contains__(self, identifier: str):
+        return identifier in self.entities
+
+    def __iter__(self):
+        return iter(list(self.entities.values()))
+
+    def __len__(self):
+        return len(self.entities)
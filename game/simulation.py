@@ -0,0 +1,168 @@
+"""
+Headless game world: the level's collision, every player's movement and the bullets in flight, stepped at a fixed
+tick without Ursina or a window. The server runs the authoritative game with it, and it can be driven directly
+from scripts.
+"""
+
+import math
+import traceback
+from collections import deque
+
+import numpy as np
+
+from level import build_collision_world
+from mapcache import MAP_PATH
+from movement import MovementParams, MovementState, simulate
+from projectiles import Projectiles
+
+# Longest step a single input command may simulate, in seconds
+MAX_INPUT_DT = 0.1
+# Input commands buffered per player between two ticks, older ones are dropped when a client floods the server
+MAX_QUEUED_INPUTS = 64
+# Most movement a player can have saved up, in seconds. Each tick adds the tick's duration, each command applied
+# spends its dt, so clients can't move faster than real time but can catch up after a late burst of commands.
+MAX_INPUT_BUDGET = 0.25
+
+
+def valid_input(cmd) -> bool:
+    """
+    Whether an input command from a client can be simulated: the sequence is a whole number, keys are -1, 0 or 1
+    and the numbers are finite
+    """
+
+    try:
+        return (
+            isinstance(cmd.sequence, int) and not isinstance(cmd.sequence, bool)
+            and cmd.forward in (-1, 0, 1) and cmd.right in (-1, 0, 1)
+            and math.isfinite(cmd.dt) and math.isfinite(cmd.yaw)
+        )
+    except TypeError:
+        return False
+
+
+class SimulatedPlayer:
+    """
+    Movement of one player, driven by its input commands
+
+    Args:
+        position (tuple): (x, y, z) where the player starts
+    """
+
+    def __init__(self, position):
+        self.movement = MovementState(position)
+        # Last input command applied, sent back to the client so it can reconcile its prediction
+        self.input_sequence = 0
+        # Rotation around the y axis of the last input command
+        self.rotation = 0
+        self.inputs = deque(maxlen=MAX_QUEUED_INPUTS)
+        # Seconds of movement the player's commands may still simulate
+        self.input_budget = MAX_INPUT_BUDGET
+
+    @property
+    def position(self) -> tuple:
+        return tuple(self.movement.position)
+
+
+class Simulation:
+    """
+    Args:
+        tick_rate (int): ticks per second
+        map_path (str): path of the map image the walls are generated from
+    """
+
+    def __init__(self, tick_rate: int = 30, map_path: str = MAP_PATH):
+        self.tick_rate = tick_rate
+        self.tick = 0
+        self.params = MovementParams()
+        self.world = build_collision_world(map_path)
+        self.players = {}
+        self.projectiles = Projectiles()
+
+    def add_player(self, identifier: str, position=(0, 0, 0)) -> SimulatedPlayer:
+        self.players[identifier] = SimulatedPlayer(position)
+        return self.players[identifier]
+
+    def remove_player(self, identifier: str):
+        self.players.pop(identifier, None)
+
+    def queue_input(self, identifier: str, cmd):
+        """
+        Buffer an input command, it is simulated on the next tick that has budget left for it. Commands that can't
+        be simulated are dropped.
+
+        Args:
+            identifier (str): player the command is for
+            cmd (InputCommand): the command
+        """
+
+        player = self.players.get(identifier)
+        if player is not None and valid_input(cmd):
+            cmd.dt = min(max(cmd.dt, 0), MAX_INPUT_DT)
+            player.inputs.append(cmd)
+
+    def apply_input(self, identifier: str, cmd) -> bool:
+        """
+        Run one of a player's input commands through the same movement step the client predicted it with. Commands
+        that are older than the last one applied are ignored.
+
+        Returns:
+            bool: whether the command was applied
+        """
+
+        player = self.players.get(identifier)
+        if player is None or not valid_input(cmd) or cmd.sequence <= player.input_sequence:
+            return False
+
+        cmd.dt = min(max(cmd.dt, 0), MAX_INPUT_DT)
+        simulate(player.movement, cmd, self.params, self.world)
+        player.input_sequence = cmd.sequence
+        player.rotation = cmd.yaw
+        return True
+
+    def spawn_projectile(self, position, direction: float, x_direction: float) -> int:
+        return self.projectiles.spawn(position, direction, x_direction)
+
+    def player_boxes(self, positions: dict = None):
+        """
+        Boxes of the players, for collision with shots and bullets
+
+        Args:
+            positions (dict): player id -> (x, y, z), the current positions if not given
+
+        Returns:
+            tuple: the player ids, and the lowest and highest corners of their boxes as arrays of shape (players, 3)
+        """
+
+        if positions is None:
+            positions = {identifier: player.position for identifier, player in self.players.items()}
+
+        identifiers = list(positions)
+        bottoms = np.array([positions[identifier] for identifier in identifiers], dtype=np.float64).reshape(-1, 3)
+        radius, height = self.params.radius, self.params.height
+        return identifiers, bottoms - (radius, 0, radius), bottoms + (radius, height, radius)
+
+    def step(self):
+        """
+        Advance the world by one tick: apply the input commands received since the last tick, as far as each
+        player's budget allows, and move the bullets
+        """
+
+        self.tick += 1
+
+        for identifier, player in self.players.items():
+            player.input_budget = min(player.input_budget + 1 / self.tick_rate, MAX_INPUT_BUDGET)
+
+            # Commands that don't fit wait for a later tick. A command that fails is dropped without stopping the
+            # other players' movement.
+            while player.inputs and player.inputs[0].dt <= player.input_budget:
+                cmd = player.inputs.popleft()
+                try:
+                    applied = self.apply_input(identifier, cmd)
+                except Exception:
+                    traceback.print_exc()
+                    continue
+                if applied:
+                    player.input_budget -= cmd.dt
+
+        _, mins, maxs = self.player_boxes()
+        self.projectiles.step(1 / self.tick_rate, self.world, mins, maxs)
@@ -0,0 +1,38 @@
+"""
+Level geometry that never moves, drawn as a few combined meshes instead of one Entity per box
+"""
+
+import ursina
+
+from walls import CUBE_CORNERS, CUBE_TRIANGLES
+
+
+class StaticGeometry:
+    """
+    Draws the boxes of walls.static_geometry with one Entity per chunk, so the whole map costs a handful of draw
+    calls. The meshes have no collider, collision goes through collision.StaticCollisionWorld.
+
+    Args:
+        geometry (dict): walls.static_geometry arrays
+        texture: texture shared by every box
+        color: color shared by every box
+    """
+
+    def __init__(self, geometry: dict, texture=None, color=ursina.color.white):
+        self.chunks = []
+
+        starts = geometry["chunks"].tolist()
+        ends = starts[1:] + [len(geometry["positions"])]
+
+        for start, end in zip(starts, ends):
+            # Indices start over in each chunk's mesh
+            first_vertex, last_vertex = start * len(CUBE_CORNERS), end * len(CUBE_CORNERS)
+            mesh = ursina.Mesh(
+                vertices=geometry["vertices"][first_vertex:last_vertex].tolist(),
+                triangles=(geometry["triangles"][start * len(CUBE_TRIANGLES):end * len(CUBE_TRIANGLES)] - first_vertex).tolist(),
+                uvs=geometry["uvs"][first_vertex:last_vertex].tolist(),
+                normals=geometry["normals"][first_vertex:last_vertex].tolist(),
+                static=True
+            )
+            self.chunks.append(ursina.Entity(model=mesh, texture=texture, color=color))
+
@@ -10,6 +10,8 @@ except ImportError:
 
 from ursina import *
 
+from movement import MovementState, InputCommand, FlatWorld, simulate, move_direction, positions_match
+
 
 class FirstPersonController(Entity):
     def __init__(self, **kwargs):
@@ -20,14 +22,12 @@ class FirstPersonController(Entity):
         self.friction = 80      # Трение на земле
         self.air_friction = 5   # Трение в воздухе
         self.max_speed = 15     # Максимальная скорость ходьбы
-        self.velocity = Vec3(0, 0, 0)  # Текущая скорость в виде вектора
+        # Состояние движения: скорость, приземление, bhop. Меняется только через movement.simulate
+        self.movement_state = MovementState()
         
         # Параметры для bhop
         self.bhop_window = 0.2  # Увеличено временное окно для bhop (в секундах)
         self.bhop_boost = 1.5    # Множитель скорости при успешном bhop
-        self.landing_time = 0    # Время последнего приземления
-        self.bhop_active = False # Флаг активного bhop
-        self.consecutive_bhops = 0  # Счетчик последовательных успешных bhop
         self.max_bhop_boost = 2.0  # Максимальный множитель скорости от bhop
         self.air_control = 0.33   # Коэффициент контроля в воздухе (1/3 от нормального)
         
@@ -36,6 +36,7 @@ class FirstPersonController(Entity):
         self.last_jump_time = 0
         
         self.height = 2
+        self.radius = .5  # Половина ширины коробки игрока для столкновений
         self.camera_pivot = Entity(parent=self, y=self.height)
 
         camera.parent = self.camera_pivot
@@ -53,22 +54,34 @@ class FirstPersonController(Entity):
         # Вычисляем начальную скорость прыжка из формулы: v_0 = sqrt(2 * g * h)
         self.jump_initial_velocity = sqrt(2 * self.gravity_value * self.jump_height)
         
-        self.grounded = False
         self.jumping = False
-        self.air_time = 0
+
+        # Команды ввода, ещё не подтверждённые сервером, для повторной симуляции после коррекции
+        self.command_sequence = 0
+        self.pending_commands = []
+        self.pending_correction = None
+        self.on_command = None
+        self.max_pending_commands = 1024
 
         self.traverse_target = scene
         self.ignore_list = [self, ]
+        # Геометрия уровня для движения (collision.StaticCollisionWorld); без неё - бесконечный пол
+        self.world = None
         self.on_destroy = self.on_disable
 
         for key, value in kwargs.items():
             setattr(self, key ,value)
 
+        if self.world is None:
+            self.world = FlatWorld()
+
         # make sure we don't fall through the ground if we start inside it
         if self.gravity_value:
-            ray = raycast(self.world_position+(0,self.height,0), self.down, traverse_target=self.traverse_target, ignore=self.ignore_list)
+            ray = self.world.raycast(self.world_position+(0,self.height,0), (0, -1, 0))
             if ray.hit:
-                self.y = ray.world_point.y
+                self.y = ray.world_point[1]
+
+        self.movement_state.position = [self.x, self.y, self.z]
         
         # Настраиваем обработчики клавиш с использованием библиотеки keyboard только для пробела
         if KEYBOARD_AVAILABLE:
@@ -89,188 +102,118 @@ class FirstPersonController(Entity):
             self.should_jump = True
             self.last_jump_time = time.time()                
 
+    # Состояние движения хранится в self.movement_state, свойства оставлены для совместимости
+    @property
+    def velocity(self):
+        return self.movement_state.velocity
+
+    @property
+    def grounded(self):
+        return self.movement_state.grounded
+
+    @property
+    def bhop_active(self):
+        return self.movement_state.bhop_active
+
+    @property
+    def consecutive_bhops(self):
+        return self.movement_state.consecutive_bhops
+
+    @property
+    def landing_time(self):
+        return self.movement_state.landing_time
+
+    @property
+    def air_time(self):
+        return self.movement_state.air_time
+
+    @property
+    def sim_time(self):
+        return self.movement_state.time
+
+    def teleport(self, position):
+        """Перемещаем игрока, минуя симуляцию движения"""
+        self.world_position = position
+        self.movement_state.position = [self.x, self.y, self.z]
+        self.movement_state.velocity = [0.0, 0.0, 0.0]
+
+    def correct(self, sequence, server_state):
+        """
+        Запоминаем состояние от сервера после команды sequence, оно будет применено в update
+
+        Args:
+            sequence (int): последняя команда, обработанная сервером
+            server_state (MovementState): состояние игрока на сервере после неё
+        """
+        # Коррекции нужны только пока команды отправляются на сервер
+        if self.on_command:
+            self.pending_correction = (sequence, server_state)
+
+    def stop_commands(self):
+        """Перестаём отправлять команды на сервер, дальше движение только локальное (например, после смерти)"""
+        self.on_command = None
+        self.pending_commands = []
+        self.pending_correction = None
+
+    def reconcile(self):
+        """Применяем коррекцию от сервера и заново проигрываем ещё не подтверждённые команды"""
+        sequence, server_state = self.pending_correction
+        self.pending_correction = None
+
+        self.pending_commands = [cmd for cmd in self.pending_commands if cmd.sequence > sequence]
+
+        state = server_state.copy()
+        for cmd in self.pending_commands:
+            simulate(state, cmd, self, self.world)
+
+        # Предсказание совпало с сервером - ничего не трогаем, чтобы не было рывков
+        if positions_match(state.position, self.movement_state.position):
+            return
+
+        self.movement_state = state
+        self.position = Vec3(*state.position)
+
     def update(self):
         self.rotation_y += mouse.velocity[0] * self.mouse_sensitivity[1]
 
         self.camera_pivot.rotation_x -= mouse.velocity[1] * self.mouse_sensitivity[0]
         self.camera_pivot.rotation_x= clamp(self.camera_pivot.rotation_x, -90, 90)
 
-        # Направление движения через обычный held_keys Ursina
-        direction_input = Vec3(
-            self.forward * (held_keys['w'] - held_keys['s'])
-            + self.right * (held_keys['d'] - held_keys['a'])
+        if self.pending_correction is not None:
+            self.reconcile()
+
+        # Команда ввода для этого кадра: направление через обычный held_keys Ursina
+        self.command_sequence += 1
+        cmd = InputCommand(
+            self.command_sequence,
+            time.dt,
+            held_keys['w'] - held_keys['s'],
+            held_keys['d'] - held_keys['a'],
+            self.rotation_y,
+            self.should_jump
         )
-            
-        # Нормализуем только если длина не равна нулю
-        self.direction = direction_input.normalized() if direction_input.length() > 0 else direction_input
-        
-        # Проверяем, нужно ли выполнить прыжок, отмеченный библиотекой keyboard
-        if self.should_jump and self.grounded:
-            # Если мы находимся в окне для bhop после приземления
-            if time.time() - self.landing_time < self.bhop_window:
-                self.bhop_active = True
-                self.consecutive_bhops += 1
-                print(f"BHOP! Множитель скорости: x{min(self.bhop_boost + (self.consecutive_bhops * 0.1), self.max_bhop_boost):.1f}")
-            
-            # Выполняем прыжок
-            self.jump()
+        self.direction = Vec3(*move_direction(cmd))
+
+        # Прыжок, отмеченный библиотекой keyboard, ждёт приземления
+        if simulate(self.movement_state, cmd, self, self.world):
             self.should_jump = False
 
-        # Проверка на столкновения 
-        feet_ray = raycast(self.position+Vec3(0,0.5,0), self.direction, traverse_target=self.traverse_target, ignore=self.ignore_list, distance=.5, debug=False)
-        head_ray = raycast(self.position+Vec3(0,self.height-.1,0), self.direction, traverse_target=self.traverse_target, ignore=self.ignore_list, distance=.5, debug=False)
-        
-        # Обновление времени для bhop
-        if self.grounded and time.time() - self.landing_time > self.bhop_window:
-            self.bhop_active = False
-            self.consecutive_bhops = 0
-            
-        # Применение ускорения к скорости
-        if not feet_ray.hit and not head_ray.hit:
-            # Ускорение в направлении движения
-            if self.direction.length() > 0:
-                # Базовое ускорение
-                acceleration_multiplier = self.acceleration
-                
-                # В воздухе меньшее ускорение от нажатия клавиш
-                if not self.grounded and not self.bhop_active:
-                    acceleration_multiplier = self.acceleration * self.air_control
-                
-                # Применяем ускорение
-                self.velocity += self.direction * acceleration_multiplier * time.dt
-            
-            # Применяем трение
-            if self.velocity.length() > 0:
-                # Выбираем силу трения в зависимости от того, на земле мы или в воздухе
-                friction_strength = self.friction if self.grounded else self.air_friction
-                
-                # Направление противоположное текущей скорости для трения
-                friction_dir = -self.velocity.normalized()
-                friction_force = friction_dir * friction_strength * time.dt
-                
-                # Применяем трение только если это не приведет к изменению направления скорости
-                if self.velocity.length() > friction_force.length():
-                    self.velocity += friction_force
-                else:
-                    # Если трение сильнее текущей скорости, останавливаемся
-                    self.velocity = Vec3(0,0,0)
-            
-            # Ограничиваем максимальную горизонтальную скорость
-            horizontal_velocity = Vec3(self.velocity.x, 0, self.velocity.z)
-            if horizontal_velocity.length() > self.max_speed:
-                horizontal_velocity = horizontal_velocity.normalized() * self.max_speed
-                self.velocity.x = horizontal_velocity.x
-                self.velocity.z = horizontal_velocity.z
-                
-            # Проверка на столкновения по каждой из осей
-            move_amount = self.velocity * time.dt
-
-            if raycast(self.position+Vec3(-.0,1,0), Vec3(1,0,0), distance=.5, traverse_target=self.traverse_target, ignore=self.ignore_list).hit:
-                move_amount.x = min(move_amount.x, 0)
-                self.velocity.x = 0
-            if raycast(self.position+Vec3(-.0,1,0), Vec3(-1,0,0), distance=.5, traverse_target=self.traverse_target, ignore=self.ignore_list).hit:
-                move_amount.x = max(move_amount.x, 0)
-                self.velocity.x = 0
-            if raycast(self.position+Vec3(-.0,1,0), Vec3(0,0,1), distance=.5, traverse_target=self.traverse_target, ignore=self.ignore_list).hit:
-                move_amount.z = min(move_amount.z, 0)
-                self.velocity.z = 0
-            if raycast(self.position+Vec3(-.0,1,0), Vec3(0,0,-1), distance=.5, traverse_target=self.traverse_target, ignore=self.ignore_list).hit:
-                move_amount.z = max(move_amount.z, 0)
-                self.velocity.z = 0
-                
-            self.position += move_amount
-
-        # Гравитация и проверка на земле
-        if self.gravity_value:
-            # Проверка на приземление
-            ray = raycast(self.world_position+(0,self.height,0), self.down, traverse_target=self.traverse_target, ignore=self.ignore_list)
-
-            if ray.distance <= self.height+.1:
-                if not self.grounded:
-                    self.land()
-                self.grounded = True
-                # Сбрасываем вертикальную скорость при приземлении
-                self.velocity.y = 0
-                # Корректируем позицию, если не стена и не слишком высоко
-                if ray.world_normal.y > .7 and ray.world_point.y - self.world_y < .5: # walk up slope
-                    self.y = ray.world_point[1]
-                return
-            else:
-                self.grounded = False
-
-            # Применяем гравитацию для параболической траектории прыжка
-            self.velocity.y -= self.gravity_value * time.dt
-            self.y += self.velocity.y * time.dt
-            
-            self.air_time += time.dt
+        self.position = Vec3(*self.movement_state.position)
+
+        # Команды копятся только если их кто-то отправляет на сервер и он будет их подтверждать
+        if self.on_command:
+            self.pending_commands.append(cmd)
+            del self.pending_commands[:-self.max_pending_commands]
+            self.on_command(cmd)
 
     def input(self, key):
         # Обрабатываем нажатие пробела напрямую (резервный метод, если keyboard не работает)
-        if not KEYBOARD_AVAILABLE and key == 'space':
-            # Если мы находимся в окне для bhop после приземления
-            if self.grounded and time.time() - self.landing_time < self.bhop_window:
-                self.bhop_active = True
-                self.consecutive_bhops += 1
-                print(f"BHOP! Множитель скорости: x{min(self.bhop_boost + (self.consecutive_bhops * 0.1), self.max_bhop_boost):.1f}")
-            self.jump()
-
-    def jump(self):
-        if not self.grounded:
-            return
-
-        self.grounded = False
-        
-        # Устанавливаем начальную скорость прыжка для параболической траектории
-        self.velocity.y = self.jump_initial_velocity
-        
-        # Получаем текущую горизонтальную скорость
-        horizontal_vel = Vec3(self.velocity.x, 0, self.velocity.z)
-        
-        # Направление движения игрока (горизонтальное)
-        horizontal_dir = Vec3(self.direction.x, 0, self.direction.z).normalized()
-        
-        # Если нажаты клавиши движения, даем дополнительный импульс в этом направлении 
-        # или усиливаем текущий импульс
-        if horizontal_dir.length() > 0:
-            # Если bhop активен, получаем более сильный импульс
-            if self.bhop_active:
-                current_boost = min(self.bhop_boost + (self.consecutive_bhops * 0.1), self.max_bhop_boost)
-                # Увеличиваем существующую горизонтальную скорость (или на bhop бонус)
-                boost_multiplier = current_boost
-            else:
-                # Обычный прыжок - увеличиваем скорость в 1.5 раза
-                boost_multiplier = 1.5
-            
-            # Если текущая скорость в нужном направлении, усиливаем её
-            if horizontal_vel.length() > 0:
-                # Вычисляем угол между текущей скоростью и направлением движения
-                same_direction = horizontal_vel.normalized().dot(horizontal_dir) > 0.7
-                
-                if same_direction:
-                    # Если движемся примерно в том же направлении, усиливаем текущую скорость
-                    boosted_vel = horizontal_vel * boost_multiplier
-                    if boosted_vel.length() > self.max_speed * boost_multiplier:
-                        boosted_vel = boosted_vel.normalized() * self.max_speed * boost_multiplier
-                else:
-                    # Если движемся в другом направлении, задаем новый импульс
-                    boosted_vel = horizontal_dir * self.max_speed * boost_multiplier
-            else:
-                # Если скорость была нулевой, задаем новый импульс
-                boosted_vel = horizontal_dir * self.max_speed * boost_multiplier
-            
-            # Применяем новую горизонтальную скорость
-            self.velocity.x = boosted_vel.x
-            self.velocity.z = boosted_vel.z
+        if not KEYBOARD_AVAILABLE and key == 'space' and self.grounded:
+            self.should_jump = True
 
     def start_fall(self):
         self.jumping = False
 
-    def land(self):
-        # print('land')
-        self.air_time = 0
-        self.grounded = True
-        self.landing_time = time.time()  # Запоминаем время приземления для bhop
-
     def on_enable(self):
         mouse.locked = True
         self.cursor.enabled = True
@@ -0,0 +1,246 @@
+"""
+Turns the black pixels of the map image into as few wall boxes as possible
+"""
+
+import numpy as np
+
+# Size of the ground plane the map image is stretched over, in world units
+PLANE_WIDTH = 2030 / 4
+PLANE_DEPTH = 830 / 4
+WALL_HEIGHT = 6
+WALL_Y = 1
+# Side of the square areas walls are grouped by into combined meshes, so far away chunks can be culled
+CHUNK_SIZE = 64
+# 24 vertices per box, keeps every chunk within 16 bit vertex indices
+MAX_BOXES_PER_CHUNK = 2048
+
+
+def _cube_faces():
+    """
+    Corners, normals and texture axes of the 6 faces of a unit cube centred on the origin, 4 vertices per face.
+    Corners go counter-clockwise seen from outside, so the faces are not culled.
+    """
+
+    corners, normals, uv_axes, uv_units = [], [], [], []
+
+    for axis in range(3):
+        for sign in (1, -1):
+            normal = [0, 0, 0]
+            normal[axis] = sign
+            # The two other axes, ordered so u x v points into the cube (Ursina's coordinates are left-handed)
+            u_axis, v_axis = (axis + 2) % 3, (axis + 1) % 3
+            if sign < 0:
+                u_axis, v_axis = v_axis, u_axis
+
+            for u, v in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                corner = [0.0, 0.0, 0.0]
+                corner[axis] = sign * 0.5
+                corner[u_axis] = u - 0.5
+                corner[v_axis] = v - 0.5
+                corners.append(corner)
+                normals.append(normal)
+                uv_axes.append((u_axis, v_axis))
+                uv_units.append((u, v))
+
+    triangles = []
+    for face in range(6):
+        first = face * 4
+        triangles += [first, first + 1, first + 2, first, first + 2, first + 3]
+
+    return (np.array(corners, dtype=np.float32), np.array(normals, dtype=np.float32), np.array(uv_axes),
+            np.array(uv_units, dtype=np.float32), np.array(triangles, dtype=np.int32))
+
+
+CUBE_CORNERS, CUBE_NORMALS, CUBE_UV_AXES, CUBE_UV_UNITS, CUBE_TRIANGLES = _cube_faces()
+
+
+def wall_mask(img_array: np.ndarray) -> np.ndarray:
+    """
+    Find the pixels that become walls: pure black (0, 0, 0) pixels that are part of a horizontal or vertical line
+    longer than one pixel. Isolated black pixels are ignored.
+
+    Args:
+        img_array (np.ndarray): RGB image of shape (height, width, 3)
+
+    Returns:
+        np.ndarray: boolean array of shape (height, width)
+    """
+
+    is_black = np.all(img_array == [0, 0, 0], axis=2)
+
+    has_neighbour = np.zeros_like(is_black)
+    has_neighbour[:, 1:] |= is_black[:, :-1]
+    has_neighbour[:, :-1] |= is_black[:, 1:]
+    has_neighbour[1:, :] |= is_black[:-1, :]
+    has_neighbour[:-1, :] |= is_black[1:, :]
+
+    return is_black & has_neighbour
+
+
+def find_runs(mask: np.ndarray):
+    """
+    Find every horizontal run of set pixels in a mask at once
+
+    Args:
+        mask (np.ndarray): boolean array of shape (height, width)
+
+    Returns:
+        tuple: three integer arrays with the row, first column and end column (exclusive) of each run,
+            ordered by row then column
+    """
+
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+
+    # +1 where a run starts, -1 just past where it ends
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    return rows, starts, ends
+
+
+def merge_rectangles(mask: np.ndarray) -> list:
+    """
+    Greedy meshing: cover the mask with rectangles by growing each one as wide as possible, then as tall as
+    possible while every row below is fully covered too. The rectangles never overlap.
+
+    The runs of every row are found at once with find_runs, and each rectangle's height with one check over the
+    rows below it, so the only Python loop is over the rectangles.
+
+    Args:
+        mask (np.ndarray): boolean array of shape (height, width)
+
+    Returns:
+        list: (x, y, width, height) rectangles in pixels
+    """
+
+    remaining = mask.copy()
+    map_height = remaining.shape[0]
+    rectangles = []
+
+    # Rows without any wall pixels are skipped
+    for y in np.unique(find_runs(mask)[0]).tolist():
+        # Runs of this row that rectangles from above haven't covered, left to right
+        _, starts, ends = find_runs(remaining[y:y + 1])
+
+        for x, end in zip(starts.tolist(), ends.tolist()):
+            covered = remaining[y + 1:, x:end].all(axis=1)
+            height = 1 + (int(np.argmin(covered)) if not covered.all() else map_height - y - 1)
+
+            remaining[y:y + height, x:end] = False
+            rectangles.append((x, y, end - x, height))
+
+    return rectangles
+
+
+def rectangles_to_boxes(rectangles: list, map_width: int, map_height: int) -> list:
+    """
+    Place pixel rectangles on the ground plane
+
+    Args:
+        rectangles (list): (x, y, width, height) rectangles in pixels
+        map_width (int): width of the map image in pixels
+        map_height (int): height of the map image in pixels
+
+    Returns:
+        list: (position, scale) pairs of (x, y, z) tuples, ready to be used for cube entities
+    """
+
+    scale_x = PLANE_WIDTH / map_width
+    scale_z = PLANE_DEPTH / map_height
+    boxes = []
+
+    for x, y, width, height in rectangles:
+        center_x = x + (width - 1) / 2
+        center_y = y + (height - 1) / 2
+        position = ((center_x - map_width / 2) * scale_x, WALL_Y, -(center_y - map_height / 2) * scale_z)
+        scale = (width * scale_x, WALL_HEIGHT, height * scale_z)
+        boxes.append((position, scale))
+
+    return boxes
+
+
+def chunk_boxes(positions: np.ndarray, chunk_size: float = CHUNK_SIZE, max_boxes: int = MAX_BOXES_PER_CHUNK):
+    """
+    Group boxes into square areas of the ground plane
+
+    Args:
+        positions (np.ndarray): box centres of shape (boxes, 3)
+        chunk_size (float): side of an area in world units
+        max_boxes (int): areas with more boxes are split into several chunks
+
+    Returns:
+        tuple: the order to put the boxes in so every chunk is contiguous, and the index of the first box of each
+            chunk in that order
+    """
+
+    cells = np.floor(positions[:, [0, 2]] / chunk_size).astype(np.int64)
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    cells = cells[order]
+
+    new_cell = np.ones(len(order), dtype=bool)
+    new_cell[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+
+    cell_starts = np.flatnonzero(new_cell)
+    index_in_cell = np.arange(len(order)) - cell_starts[np.cumsum(new_cell) - 1]
+
+    return order, np.flatnonzero(index_in_cell % max_boxes == 0)
+
+
+def box_mesh(positions: np.ndarray, scales: np.ndarray, uv_tile: float = None) -> dict:
+    """
+    Build one mesh out of many boxes
+
+    Args:
+        positions (np.ndarray): box centres of shape (boxes, 3)
+        scales (np.ndarray): box sizes of shape (boxes, 3)
+        uv_tile (float): the texture repeats every this many world units on each face, like a texture_scale of
+            the face size divided by uv_tile. None stretches the texture once over each face, like a plain cube.
+
+    Returns:
+        dict: "vertices", "normals", "uvs" and "triangles" arrays, 24 vertices and 36 indices per box in the
+            order of the boxes
+    """
+
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    scales = np.asarray(scales, dtype=np.float32).reshape(-1, 3)
+    count = len(positions)
+
+    vertices = positions[:, None, :] + CUBE_CORNERS[None, :, :] * scales[:, None, :]
+    normals = np.broadcast_to(CUBE_NORMALS, (count,) + CUBE_NORMALS.shape)
+    if uv_tile:
+        uvs = CUBE_UV_UNITS[None, :, :] * scales[:, CUBE_UV_AXES] / uv_tile
+    else:
+        uvs = np.broadcast_to(CUBE_UV_UNITS, (count,) + CUBE_UV_UNITS.shape)
+    triangles = CUBE_TRIANGLES[None, :] + (np.arange(count, dtype=np.int32) * len(CUBE_CORNERS))[:, None]
+
+    return {
+        "vertices": vertices.reshape(-1, 3).astype(np.float32),
+        "normals": normals.reshape(-1, 3).astype(np.float32),
+        "uvs": uvs.reshape(-1, 2).astype(np.float32),
+        "triangles": triangles.reshape(-1).astype(np.int32)
+    }
+
+
+def static_geometry(positions: np.ndarray, scales: np.ndarray, uv_tile: float = None) -> dict:
+    """
+    Everything needed to draw a set of boxes as a few combined meshes and to collide with them
+
+    Args:
+        positions (np.ndarray): box centres of shape (boxes, 3)
+        scales (np.ndarray): box sizes of shape (boxes, 3)
+        uv_tile (float): see box_mesh
+
+    Returns:
+        dict: "positions" and "scales" reordered by chunk, "chunks" with the first box of each chunk, and the
+            box_mesh arrays of the reordered boxes
+    """
+
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    scales = np.asarray(scales, dtype=np.float32).reshape(-1, 3)
+    order, chunks = chunk_boxes(positions)
+
+    geometry = {"positions": positions[order], "scales": scales[order], "chunks": chunks.astype(np.int32)}
+    geometry.update(box_mesh(geometry["positions"], geometry["scales"], uv_tile))
+    return geometry
@@ -17,4 +17,6 @@ class Weapon(ursina.Entity):
         self.reloadDelay = reloadDelay
         self.reloadDelayMax = reloadDelay
         self.shootDelay = shootDelay
+        # Когда был последний выстрел, чаще чем раз в shootDelay сервер выстрелы не принимает
+        self.lastShot = 0
         self.reloading = False
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Area of interest management: a uniform grid over the map used to find the players close to each other
+"""
+
+import math
+
+import numpy as np
+
+
+class SpatialGrid:
+    """
+    Buckets player positions into square cells on the ground plane, so finding the players around a point only
+    looks at nearby cells instead of every player.
+
+    Args:
+        cell_size (float): side of a cell in world units, ideally close to the query radius
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.slots = np.zeros(0, dtype=np.int64)
+        self.ground = np.zeros((0, 2))
+
+    def cell(self, position) -> tuple:
+        return math.floor(position[0] / self.cell_size), math.floor(position[2] / self.cell_size)
+
+    def rebuild(self, slots: np.ndarray, positions: np.ndarray):
+        """
+        Replace the grid's contents
+
+        Args:
+            slots (np.ndarray): slots of the players in the grid
+            positions (np.ndarray): their (x, y, z) positions, of shape (players, 3)
+        """
+
+        self.slots = slots
+        self.ground = positions[:, (0, 2)]
+        self.cells = {}
+        if not len(slots):
+            return
+
+        # Sort the players by cell, each cell is then one run of the order
+        cells = np.floor(self.ground / self.cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        sorted_cells = cells[order]
+        starts = np.flatnonzero(np.any(np.diff(sorted_cells, axis=0, prepend=sorted_cells[:1] - 1), axis=1))
+        ends = np.append(starts[1:], len(order))
+
+        for (cell_x, cell_z), start, end in zip(sorted_cells[starts].tolist(), starts, ends):
+            self.cells[cell_x, cell_z] = order[start:end]
+
+    def query(self, position, radius: float) -> np.ndarray:
+        """
+        Find the players within a horizontal distance of a point
+
+        Args:
+            position (tuple): (x, y, z) centre of the query
+            radius (float): maximum distance on the ground plane
+
+        Returns:
+            np.ndarray: slots of the players in range
+        """
+
+        x, _, z = position
+        min_x, min_z = self.cell((x - radius, 0, z - radius))
+        max_x, max_z = self.cell((x + radius, 0, z + radius))
+
+        rows = [
+            self.cells[cell_x, cell_z]
+            for cell_x in range(min_x, max_x + 1)
+            for cell_z in range(min_z, max_z + 1)
+            if (cell_x, cell_z) in self.cells
+        ]
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+
+        rows = np.concatenate(rows)
+        offsets = self.ground[rows] - (x, z)
+        return self.slots[rows[np.einsum("ij,ij->i", offsets, offsets) <= radius * radius]]
@@ -0,0 +1,109 @@
+"""
+Lag compensation: a short history of where every player was on each tick, so shots are checked against the
+positions the shooter was actually seeing instead of where the players are by the time the shot arrives
+"""
+
+import bisect
+from collections import deque
+
+import numpy as np
+
+from collision import segments_hit_boxes
+
+
+class PositionHistory:
+    """
+    Ring buffer of player positions, one entry per tick
+
+    Args:
+        size (int): number of ticks to keep, which is also the furthest shots can be rewound
+    """
+
+    def __init__(self, size: int):
+        self.ticks = deque(maxlen=size)
+        self.positions = deque(maxlen=size)
+
+    def record(self, tick: int, positions: dict):
+        """
+        Args:
+            tick (int): server tick, increasing
+            positions (dict): player id -> (x, y, z) position on that tick
+        """
+
+        self.ticks.append(tick)
+        self.positions.append(dict(positions))
+
+    def rewind(self, tick: float) -> dict:
+        """
+        Get the positions of the players at a point in the past, blending between the ticks on either side. Points
+        older than the history are clamped to its oldest tick, points in the future to its newest.
+
+        Args:
+            tick (float): fractional server tick
+
+        Returns:
+            dict: player id -> (x, y, z) position
+        """
+
+        if not self.ticks:
+            return {}
+
+        tick = min(max(tick, self.ticks[0]), self.ticks[-1])
+        after = bisect.bisect_left(self.ticks, tick)
+        if self.ticks[after] == tick:
+            return dict(self.positions[after])
+
+        start_tick, end_tick = self.ticks[after - 1], self.ticks[after]
+        start, end = self.positions[after - 1], self.positions[after]
+        t = (tick - start_tick) / (end_tick - start_tick)
+
+        # Players that joined or left in between are only known on one side
+        positions = dict(start)
+        positions.update(end)
+        for identifier in start.keys() & end.keys():
+            positions[identifier] = tuple(a + (b - a) * t for a, b in zip(start[identifier], end[identifier]))
+
+        return positions
+
+
+def trace_shot(origin, direction, positions: dict, radius: float, height: float, distance: float, world=None):
+    """
+    Find the first player a shot hits, if no wall is in the way
+
+    Args:
+        origin: (x, y, z) start of the shot
+        direction: (x, y, z) direction of the shot, doesn't need to be normalized
+        positions (dict): player id -> (x, y, z) bottom centre of the players that can be hit
+        radius (float): half the width of a player's box
+        height (float): height of a player's box
+        distance (float): range of the shot
+        world: level geometry that stops shots, a collision.StaticCollisionWorld
+
+    Returns:
+        tuple: (id of the player hit, distance along the shot), or None if nothing is hit
+    """
+
+    if not positions:
+        return None
+
+    direction = np.array(tuple(direction), dtype=np.float64)
+    direction_length = np.linalg.norm(direction)
+    if direction_length == 0:
+        return None
+
+    start = np.array([tuple(origin)], dtype=np.float64)
+    end = start + direction / direction_length * distance
+
+    identifiers = list(positions)
+    bottoms = np.array([positions[identifier] for identifier in identifiers], dtype=np.float64)
+    mins = bottoms - (radius, 0, radius)
+    maxs = bottoms + (radius, height, radius)
+
+    fractions, boxes = segments_hit_boxes(start, end, mins, maxs)
+    if boxes[0] < 0:
+        return None
+
+    if world is not None and world.segments_hit(start, end)[0] < fractions[0]:
+        return None
+
+    return identifiers[boxes[0]], float(fractions[0] * distance)
@@ -0,0 +1,348 @@
+"""
+Load generator: headless bots that join a server like the game does, walk around at random, shoot, and leave and
+rejoin, to measure how many players a server can take. Run it against a running server or lobby.
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+
+import numpy as np
+
+# Bots use the client's own networking and movement code. The client's directory goes after this one, like in main.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "game"))
+
+from network import Network
+from protocol import CODECS, TRANSPORT_UDP
+from movement import MovementParams, MovementState, InputCommand, float32, simulate
+from level import build_collision_world
+from interpolation import INTERPOLATION_DELAY
+
+# Input commands each bot sends per second
+INPUT_RATE = 30
+# How long a bot keeps walking in the same direction, in seconds
+WALK_TIME = (0.5, 3)
+# Chance of jumping on each input command
+JUMP_CHANCE = 0.01
+SPAWN_POSITION = (0, 1, 0)
+# How long to wait for the server when joining, in seconds
+CONNECT_TIMEOUT = 5
+# Bullets sent but not yet received by every other bot are forgotten after this many seconds
+BULLET_TIMEOUT = 5
+PERCENTILES = (50, 90, 99)
+
+
+class Stats:
+    """
+    Counters shared by every bot
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.joined = 0
+        self.failed = 0
+        self.disconnected = 0
+        self.sent = 0
+        self.received = 0
+        self.snapshots = 0
+        # Snapshot ticks that never arrived, because the server dropped them or they were lost on the way
+        self.missed_snapshots = 0
+        # Relayed bullet -> when it was sent, to time how long the server takes to pass it on
+        self.bullets = {}
+        self.latencies = []
+
+    def add(self, counter: str, amount: int = 1):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def bullet_sent(self, key: tuple):
+        with self.lock:
+            self.bullets[key] = time.perf_counter()
+
+    def bullet_received(self, key: tuple):
+        received = time.perf_counter()
+        with self.lock:
+            sent = self.bullets.get(key)
+            if sent is not None:
+                self.latencies.append(received - sent)
+
+    def forget_bullets(self):
+        oldest = time.perf_counter() - BULLET_TIMEOUT
+        with self.lock:
+            self.bullets = {key: sent for key, sent in self.bullets.items() if sent >= oldest}
+
+    def report(self, elapsed: float, bots: int) -> str:
+        with self.lock:
+            lines = [
+                f"{elapsed:.0f}s, {bots} bots connected, {self.joined} joins, {self.failed} failed joins, "
+                f"{self.disconnected} dropped by the server",
+                f"  sent {self.sent} messages ({self.sent / elapsed:.0f}/s), "
+                f"received {self.received} ({self.received / elapsed:.0f}/s)",
+                f"  {self.snapshots} snapshots, {self.missed_snapshots} missed"
+            ]
+
+            if self.latencies:
+                latencies = np.array(self.latencies) * 1000
+                percentiles = ", ".join(
+                    f"p{percentile} {value:.1f} ms"
+                    for percentile, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))
+                )
+                lines.append(f"  relay latency over {len(latencies)} bullets: {percentiles}, max {latencies.max():.1f} ms")
+
+        return "\n".join(lines)
+
+
+def bullet_key(position, direction: float, x_direction: float) -> tuple:
+    """
+    Identify a bullet by how it was fired, rounded like the binary encoding rounds it so the sender and the
+    receivers agree
+    """
+
+    return tuple(float32(value) for value in (*position, direction, x_direction))
+
+
+class Bot:
+    """
+    A simulated player. It predicts its own movement with the same simulation as the server, so its shots start
+    where the server expects its eyes to be.
+
+    Args:
+        name (str): username
+        args (argparse.Namespace): command line options
+        world: level geometry, a collision.StaticCollisionWorld shared by every bot
+        stats (Stats): where to count what happened
+    """
+
+    def __init__(self, name: str, args, world, stats: Stats):
+        self.name = name
+        self.args = args
+        self.world = world
+        self.stats = stats
+        self.params = MovementParams()
+        self.network = Network(args.host, args.port, name, codecs=args.codecs, transport=args.transport,
+                               room=args.room)
+
+        self.state = MovementState(SPAWN_POSITION)
+        self.state_lock = threading.Lock()
+        self.pending_commands = deque()
+        self.sequence = 0
+        self.health = 100
+        self.yaw = random.uniform(0, 360)
+        self.last_tick = None
+        self.connected = False
+
+    # What Network.send_player reads from the local player
+    @property
+    def world_x(self) -> float:
+        return self.state.position[0]
+
+    @property
+    def world_y(self) -> float:
+        return self.state.position[1]
+
+    @property
+    def world_z(self) -> float:
+        return self.state.position[2]
+
+    @property
+    def rotation_y(self) -> float:
+        return self.yaw
+
+    def run(self, stop_at: float):
+        """
+        Join, play until stop_at (a time.perf_counter value) or the end of the bot's session, then leave
+        """
+
+        self.network.settimeout(CONNECT_TIMEOUT)
+        try:
+            self.network.connect()
+        except (OSError, ValueError) as e:
+            self.stats.add("failed")
+            self.network.close()
+            print(f"{self.name} could not join: {e}")
+            return
+        self.network.settimeout(None)
+
+        self.connected = True
+        self.stats.add("joined")
+        threading.Thread(target=self.receive, daemon=True).start()
+
+        leave_at = min(stop_at, time.perf_counter() + random.expovariate(1 / self.args.session))
+        try:
+            self.play(leave_at)
+        finally:
+            self.connected = False
+            self.network.close()
+
+    def play(self, leave_at: float):
+        interval = 1 / INPUT_RATE
+        forward = right = 0
+        turn_at = 0
+        next_step = time.perf_counter()
+
+        while self.connected:
+            now = time.perf_counter()
+            if now >= leave_at:
+                return
+
+            if now >= turn_at:
+                forward, right = random.choice((-1, 0, 1)), random.choice((-1, 0, 1))
+                self.yaw = random.uniform(0, 360)
+                turn_at = now + random.uniform(*WALK_TIME)
+
+            self.sequence += 1
+            cmd = InputCommand(self.sequence, interval, forward, right, self.yaw, random.random() < JUMP_CHANCE)
+            with self.state_lock:
+                simulate(self.state, cmd, self.params, self.world)
+                self.pending_commands.append(cmd)
+
+            if self.network.authoritative:
+                self.network.send_input(cmd)
+            else:
+                self.network.send_player(self)
+            self.stats.add("sent")
+
+            if self.health > 0 and random.random() < self.args.fire_rate * interval:
+                self.shoot()
+
+            next_step += interval
+            time.sleep(max(0, next_step - time.perf_counter()))
+
+    def shoot(self):
+        x_direction = random.uniform(-10, 10)
+        yaw = math.radians(self.yaw)
+        pitch = math.radians(x_direction)
+        forward = (math.sin(yaw) * math.cos(pitch), math.sin(pitch), math.cos(yaw) * math.cos(pitch))
+
+        with self.state_lock:
+            x, y, z = self.state.position
+        eyes = (x, y + self.params.height, z)
+
+        self.stats.bullet_sent(bullet_key(eyes, self.yaw, x_direction))
+        self.network.send_bullet(eyes, self.yaw, x_direction, 0)
+        self.network.send_fire(eyes, forward, (self.network.server_time() - INTERPOLATION_DELAY) * self.network.tick_rate)
+        self.stats.add("sent", 2)
+
+    def receive(self):
+        """
+        Receiving thread: counts what arrives and applies the server's corrections to the bot's movement
+        """
+
+        while self.connected:
+            try:
+                info = self.network.receive_info()
+            except (OSError, ValueError):
+                info = None
+            except Exception as e:
+                print(e)
+                continue
+
+            if not info:
+                if self.connected:
+                    self.connected = False
+                    self.stats.add("disconnected")
+                return
+
+            self.stats.add("received")
+            self.handle(info)
+
+    def handle(self, info: dict):
+        if info["object"] == "snapshot":
+            self.stats.add("snapshots")
+            if self.last_tick is not None and info["tick"] > self.last_tick + 1:
+                self.stats.add("missed_snapshots", info["tick"] - self.last_tick - 1)
+            self.last_tick = max(info["tick"], self.last_tick or 0)
+
+        elif info["object"] == "bullet":
+            self.stats.bullet_received(bullet_key(info["position"], info["direction"], info["x_direction"]))
+
+        elif info["object"] == "health_update" and info["id"] == self.network.id:
+            self.health = info["health"]
+
+        elif info["object"] == "move_state":
+            # Same reconciliation as the client: start from the server's state and replay the newer commands
+            with self.state_lock:
+                while self.pending_commands and self.pending_commands[0].sequence <= info["sequence"]:
+                    self.pending_commands.popleft()
+
+                state = MovementState.from_dict(info)
+                for cmd in self.pending_commands:
+                    simulate(state, cmd, self.params, self.world)
+                self.state = state
+
+
+def run_slot(slot: int, join_at: float, args, world, stats: Stats, stop_at: float, bots: list):
+    """
+    Keep one bot in the game from join_at until stop_at: whenever it leaves, another one joins in its place
+    """
+
+    time.sleep(max(0, join_at - time.perf_counter()))
+    generation = 0
+
+    while time.perf_counter() < stop_at:
+        generation += 1
+        bot = Bot(f"bot{slot}-{generation}", args, world, stats)
+        bots[slot] = bot
+        bot.run(stop_at)
+        # Spread out the rejoins, and don't hammer a server that turns bots away
+        time.sleep(random.uniform(0.1, 1))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1", help="address of the server or lobby")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--bots", type=int, default=50, help="players kept in the game at once")
+    parser.add_argument("--duration", type=float, default=60, help="length of the test in seconds")
+    parser.add_argument("--ramp", type=float, default=10, help="seconds over which the bots join at the start")
+    parser.add_argument("--session", type=float, default=30,
+                        help="average seconds a bot stays before leaving and being replaced")
+    parser.add_argument("--fire-rate", type=float, default=1, help="average shots per second per bot")
+    parser.add_argument("--room", default=None, help="room to join on a lobby, any room if not given")
+    parser.add_argument("--codecs", nargs="+", default=list(CODECS), help="encodings to offer the server")
+    parser.add_argument("--transport", default=TRANSPORT_UDP, choices=("udp", "tcp"))
+    parser.add_argument("--report-interval", type=float, default=5, help="seconds between progress reports")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    world = build_collision_world()
+    stats = Stats()
+
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    bots = [None] * args.bots
+    threads = []
+
+    for slot in range(args.bots):
+        join_at = started + args.ramp * slot / args.bots
+        thread = threading.Thread(target=run_slot, args=(slot, join_at, args, world, stats, stop_at, bots),
+                                  daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    try:
+        while time.perf_counter() < stop_at:
+            time.sleep(min(args.report_interval, max(0, stop_at - time.perf_counter())))
+            stats.forget_bullets()
+            connected = sum(1 for bot in bots if bot is not None and bot.connected)
+            print(stats.report(time.perf_counter() - started, connected))
+    except KeyboardInterrupt:
+        pass
+
+    # Give the bots a moment to leave cleanly
+    for thread in threads:
+        thread.join(timeout=1)
+
+    print("Done")
+    print(stats.report(time.perf_counter() - started, 0))
+
+
+if __name__ == "__main__":
+    main()
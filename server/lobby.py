@@ -0,0 +1,310 @@
+"""
+Server script for hosting many games at once: the lobby accepts every connection on one port and hands it over to
+a room, each room running its own match in a worker process
+"""
+
+import time
+import asyncio
+import json
+import threading
+import multiprocessing
+from multiprocessing import reduction
+
+# Also makes the client's modules importable
+import main as room_server
+from protocol import FrameBuffer, ProtocolError
+
+ADDR = "0.0.0.0"
+PORT = room_server.PORT
+MSG_SIZE = 2048
+# Most rooms running at once, new players are turned away when they are all full
+MAX_ROOMS = 32
+# Rooms listen for datagrams on consecutive ports after the lobby's
+FIRST_ROOM_PORT = PORT + 1
+# How long to wait for a client's hello before sending it to any room. Clients that only say hello once they
+# have been given an id never send it to the lobby.
+HELLO_TIMEOUT = 1
+# Rooms that have had no players for this many seconds are closed
+EMPTY_ROOM_TIMEOUT = 60
+# Seconds between checks for empty and stopped rooms
+ROOM_CHECK_INTERVAL = 5
+# How long a closing room gets to stop on its own before it is terminated, in seconds
+ROOM_CLOSE_TIMEOUT = 5
+
+
+class Room:
+    """
+    A match running in its own process
+
+    Args:
+        name (str): name players ask for to join this room
+        port (int): port of the room's datagram transport
+    """
+
+    def __init__(self, name: str, port: int):
+        context = multiprocessing.get_context("spawn")
+
+        self.name = name
+        self.port = port
+        self.connection, child_connection = context.Pipe()
+        self.player_count = context.Value("i", 0)
+        self.process = context.Process(
+            target=room_server.run_room,
+            args=(name, port, child_connection, self.player_count),
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        # Hand-offs run on worker threads, the pipe takes one at a time
+        self.handoff_lock = threading.Lock()
+        # When the room last became empty, None while it has players
+        self.empty_since = time.monotonic()
+
+    @property
+    def players(self) -> int:
+        return self.player_count.value
+
+    @property
+    def full(self) -> bool:
+        return self.players >= room_server.MAX_PLAYERS
+
+    def reserve(self):
+        """
+        Count a player in before its connection is handed over, so the room isn't closed or filled meanwhile
+        """
+
+        with self.player_count.get_lock():
+            self.player_count.value += 1
+
+    def release(self):
+        """
+        Count out a reserved player whose connection couldn't be handed over
+        """
+
+        with self.player_count.get_lock():
+            self.player_count.value -= 1
+
+    def hand_off(self, sock, initial: bytes):
+        """
+        Give a reserved player's connection to the room. Blocks on the pipe, so it runs outside the event loop.
+        The lobby's copy of the socket can be closed afterwards.
+
+        Args:
+            sock: socket of the connection
+            initial (bytes): data already read from the connection
+        """
+
+        with self.handoff_lock:
+            self.connection.send_bytes(initial)
+            reduction.send_handle(self.connection, sock.fileno(), self.process.pid)
+
+    def close(self):
+        """
+        Stop the room: closing the pipe ends its worker. Blocks until the process has exited.
+        """
+
+        self.connection.close()
+        self.process.join(ROOM_CLOSE_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+class Lobby:
+    """
+    Keeps track of the rooms and decides which one each player joins
+
+    Args:
+        max_rooms (int): most rooms running at once
+        first_port (int): datagram port of the first room, the next ones count up from it
+    """
+
+    def __init__(self, max_rooms: int = MAX_ROOMS, first_port: int = FIRST_ROOM_PORT):
+        self.max_rooms = max_rooms
+        self.next_port = first_port
+        # Ports of closed rooms, reused before new ones are taken
+        self.free_ports = []
+        self.next_number = 1
+        self.rooms = {}
+
+    def open_room(self, name: str = None):
+        """
+        Start a new room
+
+        Args:
+            name (str): name of the room, one is made up if not given
+
+        Returns:
+            Room: the room, or None if there are already max_rooms rooms
+        """
+
+        if len(self.rooms) >= self.max_rooms:
+            return None
+
+        while name is None or name in self.rooms:
+            name = f"room{self.next_number}"
+            self.next_number += 1
+
+        if self.free_ports:
+            port = self.free_ports.pop()
+        else:
+            port = self.next_port
+            self.next_port += 1
+
+        room = Room(name, port)
+        self.rooms[name] = room
+        print(f"Opened room {name}...")
+        return room
+
+    def assign(self, requested: str = None):
+        """
+        Pick the room a player joins. A player that asks for a room joins it, starting it if needed. Other players
+        join the busiest room that still has space, so rooms fill up before new ones are started.
+
+        Args:
+            requested (str): name of the room the player asked for
+
+        Returns:
+            Room: the room, or None if the player can't join any
+        """
+
+        self.forget_stopped_rooms()
+
+        if requested is not None:
+            room = self.rooms.get(requested)
+            if room is None:
+                return self.open_room(requested)
+            return None if room.full else room
+
+        available = [room for room in self.rooms.values() if not room.full]
+        if available:
+            return max(available, key=lambda room: room.players)
+        return self.open_room()
+
+    def forget_stopped_rooms(self):
+        """
+        Forget rooms whose process has died
+        """
+
+        for name, room in list(self.rooms.items()):
+            if not room.process.is_alive():
+                print(f"Room {name} stopped...")
+                del self.rooms[name]
+                self.free_ports.append(room.port)
+
+    async def close_empty_rooms(self):
+        """
+        Close rooms once they have been empty for EMPTY_ROOM_TIMEOUT, so idle rooms don't keep a process ticking
+        and their names and ports can be used again
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await asyncio.sleep(ROOM_CHECK_INTERVAL)
+            self.forget_stopped_rooms()
+            now = time.monotonic()
+
+            for name, room in list(self.rooms.items()):
+                if room.players > 0:
+                    room.empty_since = None
+                elif room.empty_since is None:
+                    room.empty_since = now
+                elif now - room.empty_since >= EMPTY_ROOM_TIMEOUT:
+                    # Forgotten first, so no player is assigned to it while it closes
+                    del self.rooms[name]
+                    await loop.run_in_executor(None, room.close)
+                    self.free_ports.append(room.port)
+                    print(f"Closed empty room {name}...")
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info("peername")
+        frames = FrameBuffer()
+        initial = bytearray()
+
+        # Clients send their hello straight away, and wait for their id before sending anything else. Anything read
+        # with it is handed over to the room along with the socket.
+        try:
+            hello = await asyncio.wait_for(read_hello(reader, frames, initial), HELLO_TIMEOUT)
+        except asyncio.TimeoutError:
+            hello = {}
+        except (ConnectionError, OSError, ProtocolError):
+            writer.close()
+            return
+
+        if hello is None:
+            writer.close()
+            return
+
+        # Whatever the client sends from now on is left on the socket for the room to read. The reader has no public
+        # way to take back what it has buffered beyond the hello, so it is taken from its buffer.
+        writer.transport.pause_reading()
+        initial += reader._buffer
+        reader._buffer.clear()
+
+        requested = hello.get("room")
+        room = self.assign(requested if isinstance(requested, str) else None)
+        if room is None:
+            print(f"Rejected connection from {addr}, no room available...")
+            writer.close()
+            return
+
+        room.reserve()
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, room.hand_off, writer.get_extra_info("socket"), bytes(initial)
+            )
+        except OSError as e:
+            room.release()
+            print(e)
+        writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, ADDR, PORT)
+        print("Lobby started, listening for new connections...")
+
+        async with server:
+            close_task = asyncio.create_task(self.close_empty_rooms())
+            try:
+                await server.serve_forever()
+            finally:
+                close_task.cancel()
+
+
+async def read_hello(reader: asyncio.StreamReader, frames: FrameBuffer, initial: bytearray):
+    """
+    Read the first frame a client sends
+
+    Args:
+        reader (asyncio.StreamReader): stream of the connection
+        frames (FrameBuffer): buffer the frames are assembled in
+        initial (bytearray): collects every byte read, to be handed over to the room
+
+    Returns:
+        dict: the client's hello, empty if it isn't one, or None if the client disconnected
+    """
+
+    while True:
+        msg = await reader.read(MSG_SIZE)
+        if not msg:
+            return None
+
+        initial += msg
+        received = frames.feed(msg)
+        if not received:
+            continue
+
+        try:
+            hello = json.loads(received[0].decode("utf8"))
+        except ValueError:
+            return {}
+        return hello if isinstance(hello, dict) else {}
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(Lobby().serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Exiting")
@@ -1,160 +1,678 @@
 """
-Server script for hosting games
+Server script for hosting a game, either on its own or as one of the rooms of lobby.py
 """
 
+import os
+import sys
+import math
+import time
 import socket
+import asyncio
 import json
-import time
 import random
-import threading
+import traceback
+from multiprocessing import reduction
+
+import numpy as np
+
+# The wire protocol lives next to the client code so both ends share a single implementation. The client's
+# directory goes after this one, so the lobby's room workers import this main and not the client's.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "game"))
+
+from protocol import (pack_frame, FrameBuffer, ProtocolError, CODEC_JSON, choose_codec, encode_message, decode_message,
+                      encode_snapshot_entry, encode_snapshot, pack_datagram, unpack_datagram,
+                      TRANSPORT_UDP, UNRELIABLE_OBJECTS)
+from movement import InputCommand
+from simulation import Simulation
+from lagcomp import PositionHistory, trace_shot
+from state import PlayerStore, diff_views
+from interest import SpatialGrid
 
 ADDR = "0.0.0.0"
 PORT = 8000
-MAX_PLAYERS = 10
+MAX_PLAYERS = 100
 MSG_SIZE = 2048
+# "udp" sends movement and snapshots as datagrams on PORT next to the TCP stream, "tcp" keeps everything on the stream
+TRANSPORT = TRANSPORT_UDP
+# World-state snapshots sent to every client per second
+TICK_RATE = 30
+# Ticks of per-client snapshot history kept as possible delta baselines
+SNAPSHOT_HISTORY = 32
+# Players closer than this (in world units, on the ground plane) are sent to each other every tick
+INTEREST_RADIUS = 60
+# Players further away are only refreshed once every this many ticks
+FAR_UPDATE_INTERVAL = 10
+# Simulate movement from the clients' input commands instead of trusting the positions they report
+AUTHORITATIVE_MOVEMENT = True
+# Maximum number of outgoing messages buffered for a single client before new ones are dropped
+SEND_QUEUE_SIZE = 256
+# Furthest back in time shots are checked, in seconds. Shooters with more latency than this have to lead their targets.
+MAX_REWIND = 0.3
+# Range of a shot
+SHOT_DISTANCE = 1000
+# Furthest a shot may start from the shooter's eyes, allowing for the shooter having moved since the last update
+MAX_SHOT_OFFSET = 4
+SHOT_DAMAGE = (5, 20)
+# Shortest time between two shots, the weapons' shootDelay. Faster shots are dropped.
+FIRE_INTERVAL = 0.1
+# Shots that may arrive together when the network bunches them up, as long as the average rate stays in FIRE_INTERVAL
+MAX_FIRE_BURST = 3
+SPAWN_POSITION = (0, 1, 0)
 
-# Setup server socket
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.bind((ADDR, PORT))
-s.listen(MAX_PLAYERS)
-
+# Connection of every player that has joined: socket, send queue, codec and snapshot bookkeeping
 players = {}
+# Position, rotation and health of the players. Slots of clients that are still in the middle of joining are
+# allocated but not active.
+state = PlayerStore(MAX_PLAYERS)
+grid = SpatialGrid(INTEREST_RADIUS)
+# Datagram transport, set up in main when TRANSPORT is "udp"
+udp_transport = None
+# Port the datagram transport listens on. Each room of a lobby has its own.
+udp_port = PORT
+# Name of the room when running as one of a lobby's workers
+room_name = None
+# Level, movement and bullets, stepped by the tick loop
+simulation = Simulation(TICK_RATE)
+position_history = PositionHistory(round(MAX_REWIND * TICK_RATE) + 1)
 
 
-def generate_id(player_list: dict, max_players: int):
+def send(identifier: str, data: bytes, reliable: bool = True):
     """
-    Generate a unique identifier
+    Queue a framed message to be sent to a player without blocking the event loop.
+    If the player's queue is full (the client is not reading fast enough), unreliable data is dropped, since a
+    newer message will supersede it. A client that can't take reliable data is disconnected instead, as it
+    would otherwise miss joins, leaves and health updates for good.
 
     Args:
-        player_list (dict): dictionary of existing players
-        max_players (int): maximum number of players allowed
+        identifier (str): unique identifier of the receiving player
+        data (bytes): framed message to send
+        reliable (bool): whether the client has to receive the message
+    """
 
-    Returns:
-        str: the unique identifier
+    player_info = players.get(identifier)
+    if player_info is None:
+        return
+
+    try:
+        player_info["queue"].put_nowait(data)
+    except asyncio.QueueFull:
+        if reliable and not player_info["writer"].is_closing():
+            print(f"Player {player_info['username']} with ID {identifier} is not keeping up, disconnecting...")
+            # Drops whatever the client hasn't read yet and ends its read loop, which cleans up after it
+            player_info["writer"].transport.abort()
+
+
+def send_unreliable(identifier: str, payload: bytes):
     """
+    Send a message that a newer one will supersede, as a datagram once the player's UDP address is known
 
-    while True:
-        unique_id = str(random.randint(1, max_players))
-        if unique_id not in player_list:
-            return unique_id
+    Args:
+        identifier (str): unique identifier of the receiving player
+        payload (bytes): encoded message to send
+    """
 
+    player_info = players[identifier]
 
-def handle_messages(identifier: str):
-    client_info = players[identifier]
-    conn: socket.socket = client_info["socket"]
-    username = client_info["username"]
+    if udp_transport is None or player_info["udp_addr"] is None:
+        send(identifier, pack_frame(payload), reliable=False)
+        return
 
-    while True:
-        try:
-            msg = conn.recv(MSG_SIZE)
-        except ConnectionResetError:
-            break
+    player_info["udp_sequence"] += 1
+    udp_transport.sendto(
+        pack_datagram(0, player_info["token"], player_info["udp_sequence"], payload),
+        player_info["udp_addr"]
+    )
 
-        if not msg:
-            break
 
-        msg_decoded = msg.decode("utf8")
+class DatagramHandler(asyncio.DatagramProtocol):
+    """
+    Receives movement updates and snapshot acknowledgements sent over UDP
+    """
 
+    def datagram_received(self, data: bytes, addr):
         try:
-            left_bracket_index = msg_decoded.index("{")
-            right_bracket_index = msg_decoded.index("}") + 1
-            msg_decoded = msg_decoded[left_bracket_index:right_bracket_index]
-        except ValueError:
-            continue
+            identifier, token, sequence, payload = unpack_datagram(data)
+        except ProtocolError:
+            return
+
+        player_id = str(identifier)
+        player_info = players.get(player_id)
+        if player_info is None or player_info["token"] != token:
+            return
+
+        # Drop datagrams that arrived out of order, a newer update has already been applied
+        if sequence <= player_info["udp_last_sequence"]:
+            return
+        player_info["udp_last_sequence"] = sequence
+        player_info["udp_addr"] = addr
 
         try:
-            msg_json = json.loads(msg_decoded)
+            msg_json = decode_message(payload)
         except Exception as e:
             print(e)
+            return
+
+        if msg_json["object"] in UNRELIABLE_OBJECTS:
+            apply_message(player_id, msg_json)
+
+
+def broadcast_message(msg: dict, exclude: str = None):
+    """
+    Send a message to every player, encoding it once per codec in use
+
+    Args:
+        msg (dict): message to send
+        exclude (str): identifier of a player that shouldn't receive the message
+    """
+
+    encoded = {}
+
+    for player_id, player_info in players.items():
+        if player_id == exclude:
             continue
 
-        # print(f"Received message from player {username} with ID {identifier}")
+        codec = player_info["codec"]
+        if codec not in encoded:
+            encoded[codec] = pack_frame(encode_message(msg, codec))
+        send(player_id, encoded[codec])
+
+
+def broadcast_snapshot(tick: int):
+    """
+    Send every player one batched snapshot of all the other players, holding only what changed since the
+    last snapshot that player acknowledged. Players outside a client's area of interest are only refreshed
+    every FAR_UPDATE_INTERVAL ticks.
+
+    Args:
+        tick (int): current server tick
+    """
+
+    slots = state.active_slots()
+    grid.rebuild(slots, state.positions[slots])
+
+    # Clients sent the current state of the same fields of a player share one encoded entry. Far players can be
+    # sent the stale state one client was last sent, those entries are encoded for that client alone.
+    entries = {}
+
+    for slot in slots.tolist():
+        player_id = state.identifier(slot)
+        player_info = players[player_id]
+        codec = player_info["codec"]
+        history = player_info["snapshots"]
+
+        baseline_tick = player_info["acked"]
+        baseline = history.get(baseline_tick)
+        if baseline is None:
+            baseline_tick = 0
+
+        # Far players are only refreshed now and then, staggered by id to spread them over the interval
+        if (tick + int(player_id)) % FAR_UPDATE_INTERVAL == 0:
+            near = state.active
+        else:
+            near = np.zeros(len(state.active), dtype=bool)
+            near[grid.query(state.positions[slot], INTEREST_RADIUS)] = True
+        previous = history[next(reversed(history))] if history else None
+
+        view, current = state.view(previous, near, slot)
+        changed, masks, removed = diff_views(baseline, view)
+
+        encoded = []
+        for other_slot, mask, is_current in zip(changed.tolist(), masks.tolist(), current[changed].tolist()):
+            if not is_current:
+                encoded.append(encode_snapshot_entry(view.entry(other_slot, mask), codec))
+                continue
+
+            key = (codec, other_slot, mask)
+            if key not in entries:
+                entries[key] = encode_snapshot_entry(view.entry(other_slot, mask), codec)
+            encoded.append(entries[key])
+
+        removed = [state.identifier(other_slot) for other_slot in removed.tolist()]
+        send_unreliable(player_id, encode_snapshot(tick, baseline_tick, encoded, removed, codec))
 
-        if msg_json["object"] == "player":
-            players[identifier]["position"] = msg_json["position"]
-            players[identifier]["rotation"] = msg_json["rotation"]
-            players[identifier]["health"] = msg_json["health"]
+        # Let the client reconcile its predicted movement with the outcome of the inputs it sent
+        simulated = simulation.players[player_id]
+        if simulated.input_sequence > player_info["input_acked"]:
+            player_info["input_acked"] = simulated.input_sequence
+            move_state = simulated.movement.to_dict(simulated.input_sequence)
+            send_unreliable(player_id, encode_message(move_state, codec))
 
-        # Tell other players about player moving
+        # Forget snapshots older than the acknowledged one, or so old the client is better off with a full update
+        history[tick] = view
+        for old_tick in list(history):
+            if old_tick >= baseline_tick and old_tick > tick - SNAPSHOT_HISTORY:
+                break
+            del history[old_tick]
+
+
+async def tick_loop():
+    """
+    Broadcast world-state snapshots at a fixed rate, independently of how often clients send updates
+    """
+
+    loop = asyncio.get_running_loop()
+    interval = 1 / TICK_RATE
+    next_tick = loop.time()
+    tick = 0
+
+    while True:
+        next_tick += interval
+        delay = next_tick - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            # Fell behind, don't try to catch up with a burst of ticks
+            next_tick = loop.time()
+            await asyncio.sleep(0)
+
+        tick += 1
+
+        # A tick that fails is skipped, the game carries on with the next one
+        try:
+            run_tick(tick)
+        except Exception:
+            traceback.print_exc()
+
+
+def run_tick(tick: int):
+    """
+    Step the simulation and send the resulting snapshot
+
+    Args:
+        tick (int): current server tick
+    """
+
+    simulation.step()
+
+    if AUTHORITATIVE_MOVEMENT:
         for player_id in players:
-            if player_id != identifier:
-                player_info = players[player_id]
-                player_conn: socket.socket = player_info["socket"]
-                try:
-                    player_conn.sendall(msg_decoded.encode("utf8"))
-                except OSError:
-                    pass
-
-    # Tell other players about player leaving
-    for player_id in players:
-        if player_id != identifier:
-            player_info = players[player_id]
-            player_conn: socket.socket = player_info["socket"]
+            slot = state.slot(player_id)
+            state.positions[slot] = simulation.players[player_id].position
+            state.rotations[slot] = simulation.players[player_id].rotation
+
+    position_history.record(tick, state.position_map())
+    broadcast_snapshot(tick)
+
+
+async def write_messages(writer: asyncio.StreamWriter, queue: asyncio.Queue):
+    """
+    Drain a player's send queue into its socket, so a slow client only ever stalls itself
+    """
+
+    try:
+        while True:
+            data = await queue.get()
+            writer.write(data)
+            # Write everything that's already queued before waiting on the socket
+            while not queue.empty():
+                writer.write(queue.get_nowait())
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+
+
+async def read_frames(reader: asyncio.StreamReader, frames: FrameBuffer):
+    """
+    Wait until at least one complete frame has arrived from a client
+
+    Returns:
+        list: payloads of the received frames, empty if the client disconnected
+    """
+
+    while True:
+        try:
+            msg = await reader.read(MSG_SIZE)
+        except (ConnectionError, OSError):
+            return []
+
+        if not msg:
+            return []
+
+        try:
+            received = frames.feed(msg)
+        except ProtocolError as e:
+            print(e)
+            return []
+
+        if received:
+            return received
+
+
+def handle_message(identifier: str, msg: bytes):
+    try:
+        msg_json = decode_message(msg)
+    except Exception as e:
+        print(e)
+        return
+
+    apply_message(identifier, msg_json)
+
+
+def is_finite(*values) -> bool:
+    """
+    Whether every value is a finite number, so a client can't feed NaN or infinity into the simulation
+    """
+
+    try:
+        return all(math.isfinite(value) for value in values)
+    except TypeError:
+        return False
+
+
+def is_vector(value) -> bool:
+    """
+    Whether a value is an (x, y, z) of finite numbers
+    """
+
+    try:
+        return len(value) == 3 and is_finite(*value)
+    except TypeError:
+        return False
+
+
+def apply_message(identifier: str, msg_json: dict):
+    if msg_json["object"] == "ack":
+        players[identifier]["acked"] = max(players[identifier]["acked"], msg_json["tick"])
+        return
+
+    if msg_json["object"] == "input":
+        if AUTHORITATIVE_MOVEMENT:
+            simulation.queue_input(identifier, InputCommand.from_dict(msg_json))
+        return
+
+    if msg_json["object"] == "player":
+        # Movement is only stored, the tick loop sends it to the other players with the next snapshot. Health is
+        # decided by the server, the client's value is ignored.
+        if not AUTHORITATIVE_MOVEMENT and is_vector(msg_json["position"]) and is_finite(msg_json["rotation"]):
+            slot = state.slot(identifier)
+            state.positions[slot] = msg_json["position"]
+            state.rotations[slot] = msg_json["rotation"]
+        return
+
+    if msg_json["object"] == "fire":
+        if is_vector(msg_json["origin"]) and is_vector(msg_json["direction"]) and is_finite(msg_json["tick"]):
+            apply_fire(identifier, msg_json)
+        return
+
+    # Tell other players about the event
+    if msg_json["object"] == "bullet":
+        if not (is_vector(msg_json["position"]) and is_finite(msg_json["direction"], msg_json["x_direction"])):
+            return
+        simulation.spawn_projectile(msg_json["position"], msg_json["direction"], msg_json["x_direction"])
+        broadcast_message(msg_json, exclude=identifier)
+
+
+def apply_fire(identifier: str, msg_json: dict):
+    """
+    Check a shot against the other players where the shooter saw them, and apply its damage
+    """
+
+    if state.health[state.slot(identifier)] <= 0:
+        return
+
+    # Each FIRE_INTERVAL that passes allows one more shot, up to MAX_FIRE_BURST saved up
+    player_info = players[identifier]
+    now = time.monotonic()
+    player_info["shots"] = min(player_info["shots"] + (now - player_info["last_fire"]) / FIRE_INTERVAL, MAX_FIRE_BURST)
+    player_info["last_fire"] = now
+    if player_info["shots"] < 1:
+        return
+    player_info["shots"] -= 1
+
+    x, y, z = state.position(identifier)
+    eyes = (x, y + simulation.params.height, z)
+    origin = tuple(msg_json["origin"])
+    if sum((a - b) ** 2 for a, b in zip(origin, eyes)) > MAX_SHOT_OFFSET ** 2:
+        return
+
+    # The shooter saw the other players interpolated between ticks, no further back than MAX_REWIND
+    latest_tick = position_history.ticks[-1] if position_history.ticks else 0
+    tick = max(msg_json["tick"], latest_tick - MAX_REWIND * TICK_RATE)
+
+    targets = {
+        player_id: position
+        for player_id, position in position_history.rewind(tick).items()
+        if player_id != identifier and player_id in players and state.health[state.slot(player_id)] > 0
+    }
+
+    hit = trace_shot(origin, msg_json["direction"], targets, simulation.params.radius, simulation.params.height,
+                     SHOT_DISTANCE, simulation.world)
+    if hit is None:
+        return
+
+    target_id, _ = hit
+    target_slot = state.slot(target_id)
+    state.health[target_slot] -= random.randint(*SHOT_DAMAGE)
+    broadcast_message({"object": "health_update", "id": target_id, "health": int(state.health[target_slot])})
+
+
+async def handle_messages(identifier: str, reader: asyncio.StreamReader, frames: FrameBuffer):
+    while True:
+        received = await read_frames(reader, frames)
+        if not received:
+            break
+
+        for msg in received:
+            handle_message(identifier, msg)
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, initial: bytes = b""):
+    """
+    Run a player's connection from joining to leaving
+
+    Args:
+        reader (asyncio.StreamReader): stream of the connection
+        writer (asyncio.StreamWriter): stream of the connection
+        initial (bytes): data the lobby already read from the connection before handing it to this room
+    """
+
+    addr = writer.get_extra_info("peername")
+
+    # Accept new connection and assign unique ID
+    new_id = state.allocate()
+    if new_id is None:
+        print(f"Rejected connection from {addr}, server is full...")
+        writer.close()
+        return
+
+    frames = FrameBuffer()
+    try:
+        writer.write(pack_frame(new_id.encode("utf8")))
+        await writer.drain()
+    except (ConnectionError, OSError):
+        state.release(new_id)
+        writer.close()
+        return
+
+    try:
+        received = frames.feed(initial)
+    except ProtocolError as e:
+        print(e)
+        received = []
+    else:
+        if not received:
+            received = await read_frames(reader, frames)
+
+    if not received:
+        state.release(new_id)
+        writer.close()
+        return
+
+    try:
+        hello = json.loads(received[0].decode("utf8"))
+        username = hello["username"]
+        codec = choose_codec(hello.get("codecs", ()))
+    except (ValueError, KeyError, TypeError):
+        # Bare username from a client that doesn't negotiate an encoding
+        username = received[0].decode("utf8", errors="replace")
+        codec = CODEC_JSON
+
+    token = random.getrandbits(32)
+    welcome = {"codec": codec, "tick_rate": TICK_RATE, "authoritative": AUTHORITATIVE_MOVEMENT}
+    if room_name is not None:
+        welcome["room"] = room_name
+    if udp_transport is not None:
+        welcome["udp_port"] = udp_port
+        welcome["token"] = token
+    writer.write(pack_frame(json.dumps(welcome).encode("utf8")))
+
+    queue = asyncio.Queue(SEND_QUEUE_SIZE)
+    new_player_info = {
+        "writer": writer,
+        "queue": queue,
+        "codec": codec,
+        "username": username,
+        "snapshots": {},
+        "acked": 0,
+        "token": token,
+        "udp_addr": None,
+        "udp_sequence": 0,
+        "udp_last_sequence": 0,
+        "input_acked": 0,
+        # Shots the player may fire right now, and when the count was last updated
+        "shots": MAX_FIRE_BURST,
+        "last_fire": time.monotonic()
+    }
+
+    # Tell existing players about new player
+    broadcast_message({
+        "id": new_id,
+        "object": "player",
+        "username": new_player_info["username"],
+        "position": SPAWN_POSITION,
+        "health": state.spawn_health,
+        "joined": True,
+        "left": False
+    })
+
+    write_task = asyncio.create_task(write_messages(writer, queue))
+
+    # Tell new player about existing players
+    for player_id, player_info in list(players.items()):
+        queue.put_nowait(pack_frame(encode_message({
+            "id": player_id,
+            "object": "player",
+            "username": player_info["username"],
+            "position": state.position(player_id),
+            "health": int(state.health[state.slot(player_id)]),
+            "joined": True,
+            "left": False
+        }, codec)))
+
+    # Add new player to players list, effectively allowing it to receive messages from other players
+    players[new_id] = new_player_info
+    state.activate(new_id, SPAWN_POSITION)
+    simulation.add_player(new_id, SPAWN_POSITION)
+
+    print(f"New connection from {addr}, assigned ID: {new_id}...")
+
+    try:
+        # Messages that arrived in the same read as the username
+        for msg in received[1:]:
+            handle_message(new_id, msg)
+        await handle_messages(new_id, reader, frames)
+    finally:
+        del players[new_id]
+        state.release(new_id)
+        simulation.remove_player(new_id)
+        write_task.cancel()
+        writer.close()
+
+        # Tell other players about player leaving
+        broadcast_message({"id": new_id, "object": "player", "joined": False, "left": True})
+
+        print(f"Player {username} with ID {new_id} has left the game...")
+
+
+async def start_datagrams():
+    global udp_transport
+
+    if TRANSPORT == TRANSPORT_UDP:
+        udp_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            DatagramHandler, local_addr=(ADDR, udp_port)
+        )
+
+
+def receive_handoff(connection) -> tuple:
+    """
+    Wait for the lobby to hand over a connection
+
+    Returns:
+        tuple: data the lobby already read from the connection, and its socket
+    """
+
+    initial = connection.recv_bytes()
+    return initial, socket.socket(fileno=reduction.recv_handle(connection))
+
+
+async def serve_handoff(sock: socket.socket, initial: bytes, player_count):
+    try:
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await handle_client(reader, writer, initial)
+    finally:
+        with player_count.get_lock():
+            player_count.value -= 1
+
+
+async def serve_room(connection, player_count):
+    """
+    Run the match of a room, with the players the lobby hands over through a pipe. Returns once the lobby is gone.
+    """
+
+    await start_datagrams()
+    tick_task = asyncio.create_task(tick_loop())
+    loop = asyncio.get_running_loop()
+    clients = set()
+
+    try:
+        while True:
             try:
-                player_conn.send(json.dumps({"id": identifier, "object": "player", "joined": False, "left": True}).encode("utf8"))
-            except OSError:
-                pass
+                initial, sock = await loop.run_in_executor(None, receive_handoff, connection)
+            except (EOFError, OSError):
+                break
+
+            client = asyncio.create_task(serve_handoff(sock, initial, player_count))
+            clients.add(client)
+            client.add_done_callback(clients.discard)
+    finally:
+        tick_task.cancel()
+
+
+def run_room(name: str, port: int, connection, player_count):
+    """
+    Entry point of a lobby's room worker process
 
-    print(f"Player {username} with ID {identifier} has left the game...")
-    del players[identifier]
-    conn.close()
+    Args:
+        name (str): name of the room
+        port (int): port of the room's datagram transport
+        connection (multiprocessing.connection.Connection): pipe the lobby hands connections over through
+        player_count (multiprocessing.Value): players handed to the room that haven't left yet, shared with the
+            lobby, which counts them in
+    """
+
+    global room_name, udp_port
+
+    room_name = name
+    udp_port = port
+    print(f"Room {name} started...")
+
+    try:
+        asyncio.run(serve_room(connection, player_count))
+    except KeyboardInterrupt:
+        pass
 
 
-def main():
+async def main():
+    server = await asyncio.start_server(handle_client, ADDR, PORT, backlog=MAX_PLAYERS)
+    await start_datagrams()
     print("Server started, listening for new connections...")
 
-    while True:
-        # Accept new connection and assign unique ID
-        conn, addr = s.accept()
-        new_id = generate_id(players, MAX_PLAYERS)
-        conn.send(new_id.encode("utf8"))
-        username = conn.recv(MSG_SIZE).decode("utf8")
-        new_player_info = {"socket": conn, "username": username, "position": (0, 1, 0), "rotation": 0, "health": 100}
-
-        # Tell existing players about new player
-        for player_id in players:
-            if player_id != new_id:
-                player_info = players[player_id]
-                player_conn: socket.socket = player_info["socket"]
-                try:
-                    player_conn.send(json.dumps({
-                        "id": new_id,
-                        "object": "player",
-                        "username": new_player_info["username"],
-                        "position": new_player_info["position"],
-                        "health": new_player_info["health"],
-                        "joined": True,
-                        "left": False
-                    }).encode("utf8"))
-                except OSError:
-                    pass
-
-        # Tell new player about existing players
-        for player_id in players:
-            if player_id != new_id:
-                player_info = players[player_id]
-                try:
-                    conn.send(json.dumps({
-                        "id": player_id,
-                        "object": "player",
-                        "username": player_info["username"],
-                        "position": player_info["position"],
-                        "health": player_info["health"],
-                        "joined": True,
-                        "left": False
-                    }).encode("utf8"))
-                    time.sleep(0.1)
-                except OSError:
-                    pass
-
-        # Add new player to players list, effectively allowing it to receive messages from other players
-        players[new_id] = new_player_info
-
-        # Start thread to receive messages from client
-        msg_thread = threading.Thread(target=handle_messages, args=(new_id,), daemon=True)
-        msg_thread.start()
-
-        print(f"New connection from {addr}, assigned ID: {new_id}...")
+    async with server:
+        tick_task = asyncio.create_task(tick_loop())
+        try:
+            await server.serve_forever()
+        finally:
+            tick_task.cancel()
 
 # def inputConsole():
 #     while True:
@@ -165,11 +683,10 @@ def main():
 
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         pass
     except SystemExit:
         pass
     finally:
         print("Exiting")
-        s.close()
@@ -0,0 +1,184 @@
+"""
+Game state of every connected player, kept as arrays indexed by slot instead of one dict per player, so the tick
+loop can read and compare all players at once. What each client was last sent is kept the same way.
+"""
+
+import numpy as np
+
+from protocol import SNAPSHOT_FIELDS
+
+POSITION, ROTATION, HEALTH = (bit for _, bit, _ in SNAPSHOT_FIELDS)
+
+
+class PlayerStore:
+    """
+    Positions, rotations and health of up to a fixed number of players. Each player occupies a slot, and its
+    identifier is the slot number plus one. Freed slots are reused, most recently freed first.
+
+    Args:
+        capacity (int): most players at once
+        spawn_health (int): health of a player when it takes a slot
+    """
+
+    def __init__(self, capacity: int, spawn_health: int = 100):
+        self.spawn_health = spawn_health
+        self.positions = np.zeros((capacity, 3))
+        self.rotations = np.zeros(capacity)
+        self.health = np.zeros(capacity, dtype=np.int32)
+        self.active = np.zeros(capacity, dtype=bool)
+        # Counts the players that have taken each slot, to tell a new player from the one that left its slot
+        self.generations = np.zeros(capacity, dtype=np.int64)
+        self.free_slots = list(range(capacity - 1, -1, -1))
+
+    @staticmethod
+    def slot(identifier: str) -> int:
+        return int(identifier) - 1
+
+    @staticmethod
+    def identifier(slot: int) -> str:
+        return str(slot + 1)
+
+    def allocate(self):
+        """
+        Reserve a slot for a joining player. It stays inactive, and out of the snapshots, until activate is called.
+
+        Returns:
+            str: identifier of the player, or None if every slot is taken
+        """
+
+        if not self.free_slots:
+            return None
+        return self.identifier(self.free_slots.pop())
+
+    def activate(self, identifier: str, position):
+        slot = self.slot(identifier)
+        self.positions[slot] = position
+        self.rotations[slot] = 0
+        self.health[slot] = self.spawn_health
+        self.generations[slot] += 1
+        self.active[slot] = True
+
+    def release(self, identifier: str):
+        slot = self.slot(identifier)
+        self.active[slot] = False
+        self.free_slots.append(slot)
+
+    def active_slots(self) -> np.ndarray:
+        return np.flatnonzero(self.active)
+
+    def position(self, identifier: str) -> tuple:
+        return tuple(self.positions[self.slot(identifier)].tolist())
+
+    def position_map(self) -> dict:
+        """
+        Returns:
+            dict: player id -> (x, y, z) position of every active player
+        """
+
+        slots = self.active_slots()
+        return {self.identifier(slot): tuple(position) for slot, position in zip(slots, self.positions[slots].tolist())}
+
+    def view(self, previous, near: np.ndarray, exclude: int):
+        """
+        Build what a client is sent about the other players this tick. Players in range get their current state,
+        the others keep the state they had in the previous view, so they drop out of the delta once the client
+        has acknowledged it.
+
+        Args:
+            previous (PlayerView): view of the client's previous snapshot, None if it hasn't had one
+            near (np.ndarray): boolean mask over the slots of the players to refresh
+            exclude (int): slot of the client itself
+
+        Returns:
+            tuple: the view (PlayerView), and a boolean mask over the slots of the players it holds the current
+                state of
+        """
+
+        view = PlayerView(len(self.active)) if previous is None else previous.copy()
+
+        # Players that just joined, or took over the slot of one that left, aren't in the previous view
+        refresh = self.active & (near | ~view.present | (view.generations != self.generations))
+        refresh[exclude] = False
+
+        view.present[:] = self.active
+        view.present[exclude] = False
+        view.generations[refresh] = self.generations[refresh]
+        view.positions[refresh] = self.positions[refresh]
+        view.rotations[refresh] = self.rotations[refresh]
+        view.health[refresh] = self.health[refresh]
+        return view, refresh
+
+
+class PlayerView:
+    """
+    The state of the other players as sent to one client on one tick, indexed by slot like PlayerStore
+
+    Args:
+        capacity (int): number of slots
+    """
+
+    def __init__(self, capacity: int):
+        self.present = np.zeros(capacity, dtype=bool)
+        self.generations = np.zeros(capacity, dtype=np.int64)
+        self.positions = np.zeros((capacity, 3))
+        self.rotations = np.zeros(capacity)
+        self.health = np.zeros(capacity, dtype=np.int32)
+
+    def entry(self, slot: int, mask: int) -> dict:
+        """
+        Snapshot entry of one player
+
+        Args:
+            slot (int): slot of the player
+            mask (int): bits of protocol.SNAPSHOT_FIELDS to include
+
+        Returns:
+            dict: the player id plus the fields in mask
+        """
+
+        entry = {"id": PlayerStore.identifier(slot)}
+        if mask & POSITION:
+            entry["position"] = tuple(self.positions[slot].tolist())
+        if mask & ROTATION:
+            entry["rotation"] = float(self.rotations[slot])
+        if mask & HEALTH:
+            entry["health"] = int(self.health[slot])
+        return entry
+
+    def copy(self):
+        view = PlayerView(0)
+        view.present = self.present.copy()
+        view.generations = self.generations.copy()
+        view.positions = self.positions.copy()
+        view.rotations = self.rotations.copy()
+        view.health = self.health.copy()
+        return view
+
+
+def diff_views(baseline: PlayerView, view: PlayerView) -> tuple:
+    """
+    Work out what changed between two views, like protocol.diff_states does for dicts
+
+    Args:
+        baseline (PlayerView): view last acknowledged by the client, None for a full update
+        view (PlayerView): view as it is now
+
+    Returns:
+        tuple: slots of the players that changed, the bits of protocol.SNAPSHOT_FIELDS that changed for each of
+            them, and slots of the players no longer present
+    """
+
+    if baseline is None:
+        baseline = PlayerView(len(view.present))
+
+    added = view.present & ~(baseline.present & (baseline.generations == view.generations))
+    kept = view.present & ~added
+
+    masks = np.zeros(len(view.present), dtype=np.int64)
+    masks[added] = POSITION | ROTATION | HEALTH
+    masks[kept & np.any(view.positions != baseline.positions, axis=1)] |= POSITION
+    masks[kept & (view.rotations != baseline.rotations)] |= ROTATION
+    masks[kept & (view.health != baseline.health)] |= HEALTH
+
+    slots = np.flatnonzero(masks)
+    return slots, masks[slots], np.flatnonzero(baseline.present & ~view.present)
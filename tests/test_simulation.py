@@ -0,0 +1,163 @@
+"""
+Headless simulation: swept movement, input budgeting and validation, and lag compensated shots
+"""
+
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+# Also makes the client's modules importable
+import main
+from collision import StaticCollisionWorld
+from lagcomp import PositionHistory, trace_shot
+from movement import MovementParams, MovementState, InputCommand, max_consecutive_bhops, simulate
+from protocol import CODEC_BINARY, encode_message, decode_message
+from simulation import Simulation, MAX_INPUT_BUDGET, MAX_INPUT_DT
+
+
+@pytest.fixture
+def world():
+    world = StaticCollisionWorld()
+    # Floor with its top at y = 0
+    world.add_box((0, -0.5, 0), (200, 1, 200))
+    return world
+
+
+@pytest.fixture
+def simulation(world):
+    simulation = Simulation(tick_rate=30)
+    simulation.world = world
+    return simulation
+
+
+def test_move_and_slide_does_not_tunnel_through_thin_wall(world):
+    world.add_box((5, 1, 0), (0.05, 2, 10))
+
+    # Far more than the wall's thickness in one step
+    result = world.move_and_slide((0, 0, 0), 0.5, 2, (20, 0, 0))
+
+    assert result.position[0] <= 5 - 0.025 - 0.5 + 1e-6
+    assert result.blocked[0]
+
+
+def test_move_and_slide_slides_along_wall(world):
+    world.add_box((5, 1, 0), (0.05, 2, 10))
+
+    result = world.move_and_slide((0, 0, 0), 0.5, 2, (20, 0, 3))
+
+    assert result.position[0] <= 5 - 0.025 - 0.5 + 1e-6
+    assert result.position[2] == pytest.approx(3)
+
+
+def test_inputs_are_limited_by_budget(simulation):
+    player = simulation.add_player("1")
+    for sequence in range(1, 65):
+        simulation.queue_input("1", InputCommand(sequence, MAX_INPUT_DT, 1, 0, 0, False))
+
+    simulation.step()
+    applied = player.input_sequence
+    assert applied * MAX_INPUT_DT <= MAX_INPUT_BUDGET
+
+    # A second's worth of ticks only simulates about a second of commands
+    for _ in range(simulation.tick_rate):
+        simulation.step()
+    simulated = (player.input_sequence - applied) * MAX_INPUT_DT
+    assert simulated == pytest.approx(1, abs=MAX_INPUT_DT)
+
+
+def test_long_dt_is_clamped(simulation):
+    player = simulation.add_player("1")
+    simulation.queue_input("1", InputCommand(1, 1000, 1, 0, 0, False))
+
+    simulation.step()
+
+    assert player.input_sequence == 1
+    assert player.movement.time == pytest.approx(MAX_INPUT_DT)
+
+
+@pytest.mark.parametrize("fields", [
+    {"sequence": None},
+    {"sequence": "1"},
+    {"dt": math.nan},
+    {"yaw": math.inf},
+    {"forward": 2},
+    {"right": None}
+])
+def test_invalid_inputs_are_dropped(simulation, fields):
+    player = simulation.add_player("1")
+    info = {"sequence": 1, "dt": 1 / 60, "forward": 1, "right": 0, "yaw": 0, "jump": False}
+    info.update(fields)
+
+    simulation.queue_input("1", InputCommand.from_dict(info))
+    simulation.step()
+
+    assert not player.inputs
+    assert player.input_sequence == 0
+    assert player.movement.time == 0
+
+
+def test_failing_input_does_not_stop_other_players(simulation, monkeypatch):
+    simulation.add_player("1")
+    other = simulation.add_player("2")
+    simulation.queue_input("1", InputCommand(1, 1 / 60, 1, 0, 0, False))
+    simulation.queue_input("2", InputCommand(1, 1 / 60, 1, 0, 0, False))
+
+    apply_input = simulation.apply_input
+
+    def broken_for_first_player(identifier, cmd):
+        if identifier == "1":
+            raise TypeError("broken command")
+        return apply_input(identifier, cmd)
+
+    monkeypatch.setattr(simulation, "apply_input", broken_for_first_player)
+    simulation.step()
+
+    assert other.input_sequence == 1
+
+
+def test_consecutive_bhops_fit_move_state():
+    params = MovementParams()
+    state = MovementState((0, 0, 0))
+    # A long strip of floor to hop along
+    world = StaticCollisionWorld()
+    world.add_box((0, -0.5, 0), (4, 1, 16000))
+
+    # Hold forward and jump for over five minutes of hopping
+    for sequence in range(1, 10001):
+        simulate(state, InputCommand(sequence, 1 / 30, 1, 0, 0, True), params, world)
+        assert state.consecutive_bhops <= max_consecutive_bhops(params)
+
+    # Still on the strip
+    assert state.position[1] > -1
+    info = decode_message(encode_message(state.to_dict(10000), CODEC_BINARY))
+    assert info["consecutive_bhops"] == state.consecutive_bhops
+
+
+def test_rewound_shot_hits_where_target_was():
+    params = MovementParams()
+    history = PositionHistory(8)
+    history.record(1, {"target": (0, 0, 10)})
+    history.record(2, {"target": (5, 0, 10)})
+
+    origin, direction = (0, 1, 0), (0, 0, 1)
+
+    assert trace_shot(origin, direction, history.rewind(2), params.radius, params.height, 100) is None
+    hit = trace_shot(origin, direction, history.rewind(1), params.radius, params.height, 100)
+    assert hit is not None
+    assert hit[0] == "target"
+    assert hit[1] == pytest.approx(10 - params.radius)
+
+
+def test_rewound_shot_is_blocked_by_wall(world):
+    params = MovementParams()
+    history = PositionHistory(8)
+    history.record(1, {"target": (0, 0, 10)})
+    world.add_box((0, 1, 5), (4, 2, 0.1))
+
+    hit = trace_shot((0, 1, 0), (0, 0, 1), history.rewind(1), params.radius, params.height, 100, world)
+
+    assert hit is None
@@ -0,0 +1,84 @@
+"""
+Snapshots sent by the server, decoded and rebuilt the way clients rebuild them
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+import main
+from protocol import CODEC_JSON, CODEC_BINARY, FrameBuffer, decode_message, apply_delta
+from state import PlayerStore
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(main, "players", {})
+    monkeypatch.setattr(main, "state", PlayerStore(main.MAX_PLAYERS))
+    monkeypatch.setattr(main, "udp_transport", None)
+    monkeypatch.setattr(main.simulation, "players", {})
+    return main
+
+
+def join(server, position, codec: str) -> str:
+    identifier = server.state.allocate()
+    server.players[identifier] = {
+        "queue": asyncio.Queue(),
+        "codec": codec,
+        "snapshots": {},
+        "acked": 0,
+        "udp_addr": None,
+        "input_acked": 0
+    }
+    server.state.activate(identifier, position)
+    server.simulation.add_player(identifier, position)
+    return identifier
+
+
+def latest_snapshot(server, identifier: str) -> dict:
+    frames = FrameBuffer()
+    queue = server.players[identifier]["queue"]
+    snapshot = None
+
+    while not queue.empty():
+        for payload in frames.feed(queue.get_nowait()):
+            info = decode_message(payload)
+            if info["object"] == "snapshot":
+                snapshot = info
+
+    return snapshot
+
+
+@pytest.mark.parametrize("codec", [CODEC_JSON, CODEC_BINARY])
+def test_clients_with_different_interest_see_fresh_state(server, codec):
+    # far_client has the lowest id, so its stale view of the target is encoded first
+    far_client = join(server, (500, 0, 0), codec)
+    near_client = join(server, (10, 0, 0), codec)
+    target = join(server, (0, 0, 0), codec)
+
+    states = {far_client: {}, near_client: {}}
+    for tick in (1, 2):
+        if tick == 2:
+            server.state.positions[server.state.slot(target)] = (5, 0, 0)
+        server.broadcast_snapshot(tick)
+
+        # Nothing is acknowledged, so every snapshot is a full update against an empty baseline
+        for client in states:
+            snapshot = latest_snapshot(server, client)
+            assert snapshot["baseline"] == 0
+            states[client] = apply_delta({}, snapshot["players"], snapshot["removed"])
+
+    # The far client keeps the target where it was, the near one sees it move
+    assert tuple(states[far_client][target]["position"]) == (0, 0, 0)
+    assert tuple(states[near_client][target]["position"]) == (5, 0, 0)
+
+    # Once acknowledged, the near client's next delta has nothing left to correct
+    server.players[near_client]["acked"] = 2
+    server.broadcast_snapshot(3)
+    snapshot = latest_snapshot(server, near_client)
+    rebuilt = apply_delta(states[near_client], snapshot["players"], snapshot["removed"])
+    assert tuple(rebuilt[target]["position"]) == (5, 0, 0)